@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+What grabber.Grabber costs while /scrape prints: per-line print() time and peak memory held, for output the size of a
+noisy scrape (the recorded alert messages, printed over and over), with no capture at all, an uncapped capture (the old
+StringIO behaviour), the default ring buffer, and the ring buffer plus a file sink.
+
+The streams the Grabber passes output through to are /dev/null, so only the capture itself is being measured.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from standins import read_corpus, setup_environment
+
+def messages():
+    return [alert["message"] for alert in json.loads(read_corpus("alerts.json"))]
+
+def emit(lines, texts):
+    for i in range(lines):
+        print(texts[i % len(texts)])
+
+def run_case(case, lines, texts, devnull, trace):
+    from grabber import Grabber
+    original = sys.stdout
+    sys.stdout = devnull
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if case == "none":
+            emit(lines, texts)
+            truncated = 0
+        else:
+            grabber = Grabber(max_bytes=0 if case == "uncapped" else None, sink=devnull if case == "ring + sink" else None)
+            with grabber:
+                emit(lines, texts)
+            truncated = grabber.truncated
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+    finally:
+        if trace:
+            tracemalloc.stop()
+        sys.stdout = original
+    return elapsed, peak, truncated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000, help="print() calls per run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the fastest is reported")
+    args = parser.parse_args()
+    setup_environment()
+    import grabber
+    texts = messages()
+    volume = sum(len(texts[i % len(texts)]) + 1 for i in range(args.lines))
+    print(f"{args.lines} lines, {volume / 1024 / 1024:.1f}MB of output; ring buffer cap {grabber.MAX_BYTES // 1024}KB per stream")
+    print(f"{'capture':<14}{'us/line':>10}{'overhead':>10}{'peak KB':>12}{'truncated':>12}")
+    with open(os.devnull, "w") as devnull:
+        baseline = None
+        for case in ["none", "uncapped", "ring", "ring + sink"]:
+            elapsed = min(run_case(case, args.lines, texts, devnull, trace=False)[0] for _ in range(args.repeat))
+            _, peak, truncated = run_case(case, args.lines, texts, devnull, trace=True)
+            per_line = elapsed / args.lines * 1e6
+            baseline = per_line if baseline is None else baseline
+            print(f"{case:<14}{per_line:>10.2f}{per_line - baseline:>+10.2f}{peak / 1024:>12.1f}{truncated:>12}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
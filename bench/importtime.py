@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Cold-start import profile for the static, HTML and cron paths through lambda_function, with and without EAGER_IMPORTS.
+
+Each case runs in a fresh interpreter under `python -X importtime`, and the report sums the self time of every module imported.
+Pass --raw to dump the full -X importtime output for one case, e.g. `--raw cron:lazy`.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from standins import REPO_ROOT, SRC_DIR, setup_environment
+
+def api_event(path):
+    return {"httpMethod": "GET", "path": path, "pathParameters": {"proxy": path.strip("/")} if path.strip("/") else None, "requestContext": {"path": path}, "headers": {"Host": "localhost"}, "queryStringParameters": None}
+
+# What each path has to import before it can do its actual work.  The cron case stops short of calling NOAA/AWS.
+SCRIPTS = {
+    "static": "import lambda_function; lambda_function.lambda_handler({event!r}, None)".format(event=api_event("/static/css/custom.css")),
+    "html": "import lambda_function; lambda_function.lambda_handler({event!r}, None)".format(event=api_event("/")),
+    "cron": "import lambda_function; import handlers; handlers.orm.EventObject; handlers.feeds.fetch",
+}
+
+def run_case(script, eager, raw=False):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR
+    env.pop("EAGER_IMPORTS", None)
+    if eager:
+        env["EAGER_IMPORTS"] = "1"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if raw:
+        return result.stderr
+    total_us = 0
+    modules = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us = line.split(":", 1)[1].split("|")[0].strip()
+        total_us += int(self_us)
+        modules += 1
+    return {"modules": modules, "import_ms": total_us / 1000.0}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    parser.add_argument("--raw", help="print raw -X importtime output for one case, e.g. static:eager")
+    args = parser.parse_args()
+    setup_environment()
+
+    if args.raw:
+        path, mode = args.raw.split(":")
+        print(run_case(SCRIPTS[path], mode == "eager", raw=True))
+        return 0
+
+    print(f"{'path':<10}{'mode':<8}{'modules':>10}{'import ms':>12}")
+    for path, script in SCRIPTS.items():
+        results = {}
+        for mode in ["eager", "lazy"]:
+            runs = [run_case(script, mode == "eager") for _ in range(args.repeat)]
+            results[mode] = min(runs, key=lambda r: r["import_ms"])
+            print(f"{path:<10}{mode:<8}{results[mode]['modules']:>10}{results[mode]['import_ms']:>12.1f}")
+        saved = results["eager"]["import_ms"] - results["lazy"]["import_ms"]
+        print(f"{path:<10}{'saved':<8}{results['eager']['modules'] - results['lazy']['modules']:>10}{saved:>12.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Offline load test: replays API Gateway-shaped requests (and cron events) against lambda_function.lambda_handler from a
+pool of worker threads, with DynamoDB, SNS and the NOAA feeds replaced by the in-memory stand-ins.
+
+    python3 bench/loadtest.py                                   # default mix, 8 workers, 2000 requests
+    python3 bench/loadtest.py --concurrency 32 --ddb-latency 5  # 5ms per DynamoDB call
+    python3 bench/loadtest.py --mix page=5,static=5,cron=1      # custom mix (weights per route group)
+    python3 bench/loadtest.py --json > capacity.json            # raw numbers, to diff against a later run
+
+The request sequence is drawn from --seed up front, so two runs with the same arguments replay the same traffic.
+Latencies are wall-clock per request, including any time spent waiting on the GIL or the stand-ins' locks.  After the
+concurrent phase, each route is replayed on its own under tracemalloc to measure the memory it allocates per request.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+from run_bench import percentile
+from standins import install
+
+# group -> routes in it; a request picks a group by weight, then a route within it uniformly.
+ROUTE_GROUPS = {
+    "page": ["index", "events list", "events code", "event view", "search"],
+    "static": ["static css", "static js", "favicon"],
+    "api": ["stats", "accuracy", "daily max"],
+    "scrape": ["scrape"],
+    "cron": ["cron"],
+}
+DEFAULT_MIX = "page=50,static=35,api=12,scrape=1,cron=2"
+# /scrape runs under a Grabber, which swaps the process-wide sys.stdout/stderr for the duration, so it can't share the
+# process with other requests.  It never has to in Lambda (one request per container at a time); here it waits for the
+# other workers to drain and runs alone.
+EXCLUSIVE_ROUTES = {"scrape"}
+SEARCHES = ["boulder", "geomag*", "station:boulder", "code:wark*", "xray_class:m*"]
+
+def api_event(path, qs=None):
+    return {
+        "httpMethod": "GET",
+        "path": path,
+        "pathParameters": {"proxy": path.strip("/")} if path.strip("/") else None,
+        "requestContext": {"path": path},
+        "headers": {"Host": "localhost", "Accept-Encoding": "gzip, br"},
+        "queryStringParameters": qs,
+        "body": None,
+    }
+
+def make_event(route, rng, keys):
+    code, serial = rng.choice(keys)
+    if route == "index":
+        return api_event("/")
+    if route == "events list":
+        return api_event("/events/list")
+    if route == "events code":
+        return api_event(f"/events/{code}")
+    if route == "event view":
+        return api_event(f"/events/{code}/{serial}")
+    if route == "search":
+        return api_event("/events/search", qs={"q": rng.choice(SEARCHES)})
+    if route == "static css":
+        return api_event("/static/css/custom.css")
+    if route == "static js":
+        return api_event("/static/js/gpx.js")
+    if route == "favicon":
+        return api_event("/favicon.ico")
+    if route == "stats":
+        return api_event("/stats", qs={"rollup": "code,month"})
+    if route == "accuracy":
+        return api_event("/forecasts/accuracy")
+    if route == "daily max":
+        return api_event("/forecasts/daily_max", qs={"kind": rng.choice(["kp", "ap"])})
+    if route == "scrape":
+        return api_event("/scrape")
+    if route == "cron":
+        return {"source": "cron"}
+    raise ValueError(f"Unknown route {route}")
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        group, _, weight = part.partition("=")
+        if group not in ROUTE_GROUPS:
+            raise SystemExit(f"Unknown route group '{group}'; choose from {', '.join(ROUTE_GROUPS)}.")
+        weights[group] = float(weight or 1)
+    return weights
+
+def schedule(weights, count, seed, keys):
+    rng = random.Random(seed)
+    groups = list(weights)
+    picks = rng.choices(groups, weights=[weights[g] for g in groups], k=count)
+    requests = []
+    for group in picks:
+        route = rng.choice(ROUTE_GROUPS[group])
+        requests.append((route, make_event(route, rng, keys)))
+    return requests
+
+def call(handler, event):
+    try:
+        response = handler(event, None)
+        return response.get("statusCode", 200) if isinstance(response, dict) else 200, None
+    except Exception as e:
+        return None, type(e).__name__
+
+class SharedExclusiveLock(object):
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.shared = 0
+        self.exclusive = False
+
+    @contextlib.contextmanager
+    def hold(self, exclusive=False):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.exclusive and (not exclusive or self.shared == 0))
+            if exclusive:
+                self.exclusive = True
+            else:
+                self.shared += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                if exclusive:
+                    self.exclusive = False
+                else:
+                    self.shared -= 1
+                self.condition.notify_all()
+
+def run_concurrent(handler, requests, concurrency):
+    results = []
+    lock = threading.Lock()
+    isolation = SharedExclusiveLock()
+    position = iter(range(len(requests)))
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                break
+            route, event = requests[i]
+            with isolation.hold(exclusive=route in EXCLUSIVE_ROUTES):
+                start = time.perf_counter()
+                status, error = call(handler, event)
+                local.append((route, time.perf_counter() - start, status, error))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+def allocations(handler, requests, repeat):
+    """
+    {route: peak KB traced while handling one request}, median over repeat requests per route.
+    """
+    by_route = {}
+    for route, event in requests:
+        by_route.setdefault(route, []).append(event)
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for route, events in by_route.items():
+            samples = []
+            for event in (events * repeat)[:repeat]:
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                call(handler, event)
+                samples.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+            peaks[route] = sorted(samples)[len(samples) // 2]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def summarize(results, elapsed, peaks):
+    routes = {}
+    for route, latency, status, error in results:
+        r = routes.setdefault(route, {"latencies": [], "statuses": {}, "errors": {}})
+        r["latencies"].append(latency)
+        if error:
+            r["errors"][error] = r["errors"].get(error, 0) + 1
+        else:
+            r["statuses"][str(status)] = r["statuses"].get(str(status), 0) + 1
+    summary = {
+        "requests": len(results),
+        "seconds": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0,
+        "errors": sum(sum(r["errors"].values()) for r in routes.values()),
+        "routes": {},
+    }
+    for route, r in sorted(routes.items()):
+        latencies = r["latencies"]
+        summary["routes"][route] = {
+            "count": len(latencies),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "alloc_kb": peaks.get(route),
+            "statuses": r["statuses"],
+            "errors": r["errors"],
+        }
+    return summary
+
+def report(summary, args):
+    print(f"{summary['requests']} requests in {summary['seconds']:.2f}s with {args.concurrency} workers: {summary['throughput']:.1f} req/s, {summary['errors']} errors")
+    print(f"  latency injected: ddb {args.ddb_latency}ms, sns {args.sns_latency}ms, http {args.http_latency}ms")
+    print(f"{'route':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'alloc KB':>10}  statuses")
+    for route, r in summary["routes"].items():
+        alloc = f"{r['alloc_kb']:>10.1f}" if r["alloc_kb"] is not None else f"{'-':>10}"
+        statuses = ", ".join(f"{k}x{v}" for k, v in sorted(r["statuses"].items()))
+        errors = ", ".join(f"{k}x{v}" for k, v in sorted(r["errors"].items()))
+        print(f"{route:<14}{r['count']:>7}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{alloc}  {statuses}{'  ERRORS ' + errors if errors else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route group weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1859)
+    parser.add_argument("--ddb-latency", type=float, default=0, help="ms added to every DynamoDB stand-in call")
+    parser.add_argument("--sns-latency", type=float, default=0, help="ms added to every SNS publish")
+    parser.add_argument("--http-latency", type=float, default=0, help="ms added to every NOAA feed fetch")
+    parser.add_argument("--alloc-repeat", type=int, default=5, help="requests per route for the allocation pass; 0 skips it")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    # The handlers (and sneks, from import onwards) print every response; none of that is wanted in the report.
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        database, sns, adapter = install(ddb_latency=args.ddb_latency / 1000, sns_latency=args.sns_latency / 1000, http_latency=args.http_latency / 1000)
+        import handlers
+        import lambda_function
+        import orm
+
+        # Start from a populated store, as a warm production table would be.
+        handlers.scrape_stuff({"source": "cron"})
+        keys = [(e["space_weather_message_code"], int(e["serial_number"])) for e in orm.EventObject.scan_all()]
+        requests = schedule(parse_mix(args.mix), args.requests, args.seed, keys)
+        results, elapsed = run_concurrent(lambda_function.lambda_handler, requests, args.concurrency)
+        peaks = allocations(lambda_function.lambda_handler, requests, args.alloc_repeat) if args.alloc_repeat else {}
+    summary = summarize(results, elapsed, peaks)
+    summary["parameters"] = {k: v for k, v in vars(args).items() if k != "json"}
+    summary["sns_published"] = len(sns.published)
+    summary["feed_fetches"] = adapter.requests
+    if args.json:
+        print(json.dumps(summary, indent=2, sort_keys=True))
+    else:
+        report(summary, args)
+    return 1 if summary["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
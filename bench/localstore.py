@@ -0,0 +1,262 @@
+"""
+In-memory stand-in for the DynamoDB tables, for benchmarks, load tests and the --local modes of the src/ tools.
+
+    db = LocalDatabase()
+    db.install(EventObject, ForecastObject, StateObject)
+
+After that the ORM classes read and write plain dicts in this process instead of talking to AWS.
+Table schemas come from the same SamTemplate.json that creates the real tables.
+"""
+
+import copy
+import json
+import os
+import re
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import AttributeBase
+from sneks.ddb.orm import SamTable
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SamTemplate.json")
+
+def _condition_failed(operation):
+    return ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}}, operation)
+
+def _get_path(item, name):
+    value = item
+    for piece in name.split("."):
+        if not isinstance(value, dict) or piece not in value:
+            return None
+        value = value[piece]
+    return value
+
+def _value(item, v):
+    if isinstance(v, AttributeBase):
+        return _get_path(item, v.name)
+    return v
+
+def evaluate(condition, item):
+    """
+    Evaluates a boto3.dynamodb.conditions condition (Key(...).eq(...) & Attr(...).exists() etc.) against a plain item.
+    """
+    if condition is None:
+        return True
+    expression = condition.get_expression()
+    op = expression["operator"]
+    values = expression["values"]
+    if op == "AND":
+        return evaluate(values[0], item) and evaluate(values[1], item)
+    if op == "OR":
+        return evaluate(values[0], item) or evaluate(values[1], item)
+    if op == "NOT":
+        return not evaluate(values[0], item)
+    if op == "attribute_exists":
+        return _get_path(item, values[0].name) is not None
+    if op == "attribute_not_exists":
+        return _get_path(item, values[0].name) is None
+    args = [_value(item, v) for v in values]
+    if args[0] is None:
+        return False
+    if op == "=":
+        return args[0] == args[1]
+    if op == "<>":
+        return args[0] != args[1]
+    if op == "<":
+        return args[0] < args[1]
+    if op == "<=":
+        return args[0] <= args[1]
+    if op == ">":
+        return args[0] > args[1]
+    if op == ">=":
+        return args[0] >= args[1]
+    if op == "BETWEEN":
+        return args[1] <= args[0] <= args[2]
+    if op == "begins_with":
+        return args[0].startswith(args[1])
+    if op == "contains":
+        return args[1] in args[0]
+    if op == "IN":
+        return args[0] in args[1]
+    raise NotImplementedError(f"Condition operator '{op}' isn't supported by the local stand-in.")
+
+_UPDATE_CLAUSE = re.compile(r"\b(SET|ADD|REMOVE)\b")
+
+class LocalTable(object):
+    def __init__(self, schema, database, latency=0):
+        self.schema = schema
+        self.name = schema["TableName"]
+        self.database = database
+        self.latency = latency
+        self.items = {}
+        self.lock = threading.RLock()
+        self.meta = database
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _key_names(self, index_name=None):
+        key_schema = self.schema["KeySchema"]
+        if index_name:
+            key_schema = [gsi for gsi in self.schema.get("GlobalSecondaryIndexes", []) if gsi["IndexName"] == index_name][0]["KeySchema"]
+        hash_key = [k["AttributeName"] for k in key_schema if k["KeyType"] == "HASH"][0]
+        range_keys = [k["AttributeName"] for k in key_schema if k["KeyType"] == "RANGE"]
+        return hash_key, range_keys[0] if range_keys else None
+
+    def _key(self, item):
+        return tuple(item[k] for k in self._key_names() if k)
+
+    def _key_dict(self, item, index_name=None):
+        names = set(n for n in self._key_names() if n)
+        if index_name:
+            names.update(n for n in self._key_names(index_name) if n)
+        return {n: item[n] for n in names}
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        self._wait()
+        with self.lock:
+            key = self._key(Item)
+            if not evaluate(ConditionExpression, self.items.get(key, {})):
+                raise _condition_failed("PutItem")
+            self.items[key] = copy.deepcopy(Item)
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self._wait()
+        with self.lock:
+            item = self.items.get(self._key(Key))
+            return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def delete_item(self, Key, ConditionExpression=None, **kwargs):
+        self._wait()
+        with self.lock:
+            key = self._key(Key)
+            if not evaluate(ConditionExpression, self.items.get(key, {})):
+                raise _condition_failed("DeleteItem")
+            self.items.pop(key, None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames={}, ExpressionAttributeValues={}, ConditionExpression=None, ReturnValues="NONE", **kwargs):
+        # Only the simple forms the app uses: "SET a = :v, ...", "ADD a :v, ..." and "REMOVE a, ...".
+        self._wait()
+        with self.lock:
+            key = self._key(Key)
+            item = self.items.get(key, copy.deepcopy(Key))
+            if not evaluate(ConditionExpression, self.items.get(key, {})):
+                raise _condition_failed("UpdateItem")
+            pieces = _UPDATE_CLAUSE.split(UpdateExpression)
+            for action, body in zip(pieces[1::2], pieces[2::2]):
+                for clause in [c.strip() for c in body.split(",") if c.strip()]:
+                    if action == "SET":
+                        name, value = [x.strip() for x in clause.split("=", 1)]
+                        item[ExpressionAttributeNames.get(name, name)] = copy.deepcopy(ExpressionAttributeValues[value])
+                    elif action == "ADD":
+                        name, value = clause.split()
+                        name = ExpressionAttributeNames.get(name, name)
+                        value = ExpressionAttributeValues[value]
+                        if isinstance(value, set):
+                            item[name] = set(item.get(name, set())) | value
+                        else:
+                            item[name] = item.get(name, 0) + value
+                    else:
+                        item.pop(ExpressionAttributeNames.get(clause, clause), None)
+            self.items[key] = item
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": copy.deepcopy(item)}
+        return {}
+
+    def _search(self, items, IndexName=None, ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, Select=None):
+        if IndexName:
+            hash_key, range_key = self._key_names(IndexName)
+            items = [i for i in items if hash_key in i]
+        else:
+            hash_key, range_key = self._key_names()
+        if range_key:
+            items = [i for i in items if range_key in i]
+            items.sort(key=lambda i: (i[range_key], self._key(i)), reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            position = [n for n, i in enumerate(items) if self._key(i) == self._key(ExclusiveStartKey)]
+            items = items[position[0]+1:] if position else items
+        last_key = None
+        if Limit and len(items) > Limit:
+            items = items[:Limit]
+            last_key = self._key_dict(items[-1], IndexName)
+        response = {"Count": len(items), "ScannedCount": len(items)}
+        if Select != "COUNT":
+            response["Items"] = copy.deepcopy(items)
+        if last_key:
+            response["LastEvaluatedKey"] = last_key
+        return response
+
+    def query(self, KeyConditionExpression, FilterExpression=None, **kwargs):
+        self._wait()
+        kwargs.pop("ReturnConsumedCapacity", None)
+        with self.lock:
+            items = [i for i in self.items.values() if evaluate(KeyConditionExpression, i)]
+        # Like the real thing, Limit applies before the filter.
+        response = self._search(items, **kwargs)
+        if FilterExpression is not None and "Items" in response:
+            response["Items"] = [i for i in response["Items"] if evaluate(FilterExpression, i)]
+            response["Count"] = len(response["Items"])
+        return response
+
+    def scan(self, FilterExpression=None, **kwargs):
+        self._wait()
+        kwargs.pop("ReturnConsumedCapacity", None)
+        with self.lock:
+            items = list(self.items.values())
+        response = self._search(items, **kwargs)
+        if FilterExpression is not None and "Items" in response:
+            response["Items"] = [i for i in response["Items"] if evaluate(FilterExpression, i)]
+            response["Count"] = len(response["Items"])
+        return response
+
+class LocalDatabase(object):
+    """
+    Holds the local tables and doubles as the low-level client (table.meta.client) used for batch calls.
+    """
+    def __init__(self, latency=0, template_path=TEMPLATE_PATH):
+        self.latency = latency
+        self.tables = {}
+        with open(template_path) as f:
+            self.template = json.load(f)
+
+    @property
+    def client(self):
+        return self
+
+    def install(self, *classes):
+        for cls in classes:
+            logical_name = cls._CF_LOGICAL_NAME
+            schema = copy.deepcopy(self.template["Resources"][logical_name]["Properties"])
+            schema["TableName"] = f"local-{logical_name}"
+            table = LocalTable(schema, self, latency=self.latency)
+            self.tables[table.name] = table
+            cls._SCHEMA = classmethod(lambda c, schema=schema: schema)
+            cls._SCHEMA_CACHE = schema
+            cls._TABLE_CACHE = SamTable(table)
+        return self
+
+    def clear(self):
+        for table in self.tables.values():
+            with table.lock:
+                table.items.clear()
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        for name, requests in RequestItems.items():
+            table = self.tables[name]
+            for request in requests:
+                if "PutRequest" in request:
+                    table.put_item(Item=request["PutRequest"]["Item"])
+                else:
+                    table.delete_item(Key=request["DeleteRequest"]["Key"])
+        return {"UnprocessedItems": {}, "ConsumedCapacity": []}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            responses[name] = [r["Item"] for r in [table.get_item(Key=k) for k in request["Keys"]] if "Item" in r]
+        return {"Responses": responses, "UnprocessedKeys": {}, "ConsumedCapacity": []}
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Per-route dispatch overhead: finding the handler for a request and building its kwargs (preprocessors included), with
+sneks' ListMatcher over lambda_function's routes versus the PrefixRouter it now uses.  Handlers aren't called.
+
+Before timing anything it checks that both pick the same handler for an example path generated from every registered
+route's pattern, plus the paths in EXTRA_PATHS, and exits non-zero if they ever disagree.
+
+    python3 bench/router_bench.py --check    # just the check
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from standins import setup_environment
+
+def api_event(path, qs=None, body=None):
+    return {
+        "httpMethod": "POST" if body else "GET",
+        "path": path,
+        "pathParameters": {"proxy": path.strip("/")} if path.strip("/") else None,
+        "requestContext": {"path": path},
+        "headers": {"Host": "localhost"},
+        "queryStringParameters": qs,
+        "body": json.dumps(body) if body else None,
+    }
+
+CASES = [
+    ("favicon", api_event("/favicon.ico")),
+    ("static css", api_event("/static/css/custom.css")),
+    ("static dist", api_event("/static/dist/css/custom.292725970840.css")),
+    ("index", api_event("/")),
+    ("page", api_event("/map.html", qs={"route_id": "7"})),
+    ("events list", api_event("/events/list")),
+    ("events code", api_event("/events/WARK04")),
+    ("event view", api_event("/events/WARK04/4223")),
+    ("search", api_event("/events/search", qs={"q": "station:boulder"})),
+    ("accuracy", api_event("/forecasts/accuracy", body={"ignored": list(range(200))})),
+    ("stats", api_event("/stats", qs={"rollup": "code"})),
+    ("debug", api_event("/debug")),
+    ("404", api_event("/no/such/page")),
+]
+
+# Paths that the generated examples don't cover: wildcard routes hit from other prefixes, near misses, and the 404.
+EXTRA_PATHS = [
+    "/", "", "/index.html", "/map.html", "/no_such_page.html", "/Caps.html", "/events/list.html",
+    "/debug", "/debug/", "/events/debug", "/x/debugger/y", "/favicon.ico", "/static/favicon.ico", "/events/favicon.ico",
+    "/static", "/static/", "/static/dist", "/static/dist/", "/scrape/now", "/scrapes", "/events", "/events/",
+    "/events/wark04", "/events/WARK04/x", "/events/WARK04/4223/extra", "/forecasts", "/forecasts/drift/2023-4-1",
+    "/stats/extra", "/no/such/page", "/-", "/_/x",
+]
+
+def example(pattern):
+    """
+    A short string that pattern matches: the smallest repeat count (but at least one), the first alternative, the first
+    character of each class.
+    """
+    def generate(items):
+        out = []
+        for op, arg in items:
+            name = str(op)
+            if name == "LITERAL":
+                out.append(chr(arg))
+            elif name == "ANY":
+                out.append(".")
+            elif name == "IN":
+                for kind, value in arg:
+                    if str(kind) == "LITERAL":
+                        out.append(chr(value))
+                        break
+                    if str(kind) == "RANGE":
+                        out.append(chr(value[0]))
+                        break
+            elif name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+                low, _, item = arg
+                out.append(generate(item) * max(low, 1))
+            elif name == "SUBPATTERN":
+                out.append(generate(arg[-1]))
+            elif name == "BRANCH":
+                out.append(generate(arg[1][0]))
+            elif name == "AT":
+                continue
+            else:
+                raise ValueError(f"Can't generate an example for {pattern} ({name})")
+        return "".join(out)
+    return generate(sre_parse.parse(pattern))
+
+def check_paths(routes):
+    paths = []
+    for route in routes:
+        sample = example(route.matcher.pattern)
+        assert route.matcher.match(sample), f"Generated {sample!r} doesn't match {route.matcher.pattern}"
+        paths.append("/" + sample.lstrip("/"))
+    return paths + EXTRA_PATHS
+
+def check(linear, indexed, routes):
+    """
+    Returns the paths (as (path, ListMatcher's handler, PrefixRouter's handler)) where the two routers disagree.
+    """
+    mismatches = []
+    for path in check_paths(routes):
+        event = api_event(path)
+        function, _ = linear.match_event(event)
+        indexed_function, _ = indexed.match_event(event)
+        if function is not indexed_function:
+            mismatches.append((path, function, indexed_function))
+    return mismatches
+
+def per_call_us(match_event, event, iterations):
+    match_event(event)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        match_event(event)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    parser.add_argument("--check", action="store_true", help="only check that both routers agree, without timing them")
+    args = parser.parse_args()
+    setup_environment()
+    from sneks.sam.response_core import ListMatcher
+    import lambda_function
+    routes = lambda_function.route_list()
+    linear = ListMatcher(routes)
+    indexed = lambda_function.PrefixRouter(routes)
+
+    mismatches = check(linear, indexed, routes)
+    for path, function, indexed_function in mismatches:
+        print(f"MISMATCH {path!r}: ListMatcher picks {getattr(function, '__name__', function)}, PrefixRouter picks {getattr(indexed_function, '__name__', indexed_function)}")
+    print(f"Routers agree on {len(check_paths(routes)) - len(mismatches)} of {len(check_paths(routes))} paths.")
+    if mismatches:
+        return 1
+    if args.check:
+        return 0
+
+    print(f"{'route':<14}{'handler':<26}{'list us':>10}{'indexed us':>12}{'speedup':>9}")
+    for name, event in CASES:
+        function, _ = linear.match_event(event)
+        indexed_function, _ = indexed.match_event(event)
+        assert function is indexed_function, f"{name}: routers disagree ({function} vs {indexed_function})"
+        before = min(per_call_us(linear.match_event, event, args.iterations) for _ in range(args.repeat))
+        after = min(per_call_us(indexed.match_event, event, args.iterations) for _ in range(args.repeat))
+        print(f"{name:<14}{function.__name__:<26}{before:>10.2f}{after:>12.2f}{before / after:>8.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Offline parser/ingest benchmarks against the recorded SWPC corpus in bench/corpus.
+
+    python3 bench/run_bench.py                   # run and print the report
+    python3 bench/run_bench.py --save-baseline   # record the current numbers as the baseline
+    python3 bench/run_bench.py --check           # exit non-zero if any stage's p50 regressed past --threshold
+
+Baselines are machine-specific, so record one on the machine you're comparing on before making a change.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from standins import BENCH_DIR, install, read_corpus
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered)-1, int(round(pct/100.0 * (len(ordered)-1))))
+    return ordered[index]
+
+def measure(func, iterations, warmup=3):
+    for _ in range(warmup):
+        func()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latencies, peak
+
+def stages(database):
+    import handlers
+    import orm
+
+    alerts = json.loads(read_corpus("alerts.json"))
+    messages = [a["message"] for a in alerts]
+    short_forecast = read_corpus("3-day-geomag-forecast.txt")
+    month_forecast = read_corpus("27-day-outlook.txt")
+
+    def scrape():
+        database.clear()
+        handlers.scrape_stuff({"source": "cron"})
+
+    # (name, function, messages handled per call)
+    return [
+        ("orm.parse_event", lambda: [orm.parse_event(m) for m in messages], len(messages)),
+        ("EventObject.parse_event", lambda: [orm.EventObject.parse_event(a) for a in alerts], len(alerts)),
+        ("ForecastObject.from_short_forecast", lambda: orm.ForecastObject.from_short_forecast(short_forecast), 1),
+        ("ForecastObject.from_month_forecast", lambda: orm.ForecastObject.from_month_forecast(month_forecast), 1),
+        ("handlers.scrape_stuff", scrape, len(alerts) + 2),
+    ]
+
+def run(iterations):
+    database, sns, adapter = install()
+    results = {}
+    for name, func, count in stages(database):
+        # The parser and scraper are chatty; keep their output out of the report.
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies, peak = measure(func, iterations)
+        mean = sum(latencies) / len(latencies)
+        results[name] = {
+            "messages_per_sec": count / mean,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "peak_kb": peak / 1024,
+        }
+    return results
+
+def report(results):
+    print(f"{'stage':<38}{'msgs/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>10}")
+    for name, r in results.items():
+        print(f"{name:<38}{r['messages_per_sec']:>12.0f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['peak_kb']:>10.1f}")
+
+def check(results, baseline, threshold):
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        allowed = baseline[name]["p50_ms"] * (1 + threshold)
+        if r["p50_ms"] > allowed:
+            regressions.append(f"{name}: p50 {r['p50_ms']:.3f}ms vs baseline {baseline[name]['p50_ms']:.3f}ms (allowed {allowed:.3f}ms)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed fractional p50 slowdown before --check fails")
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        report(results)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+    if args.check:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --save-baseline first.")
+            return 1
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = check(results, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS:")
+            for r in regressions:
+                print(f"  {r}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
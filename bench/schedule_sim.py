@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Replays the recorded April 2023 storm (the alerts in bench/corpus/alerts.json and the 3-day forecast issued during it)
+through src/scheduler.py on a simulated clock, and reports how many cron invocations and feed fetches each polling
+strategy would have made and how long each alert took to be picked up.
+
+    fixed      every feed on every tick of a rate(--rate minutes) rule, as deployed before the scheduler
+    skip       the same fixed rule, but each run only fetches the feeds the scheduler says are due (no SCHEDULE_RULE_NAME)
+    adaptive   the scheduler also moves the rule's rate to the next time a feed is due
+
+An alert counts as picked up on the first events fetch at or after the time it was issued.  The 27-day outlook is
+treated as published at the start of the replay.  Alerts issued while the scheduler's activity level was 2 or more (as
+it would have been computed from the alerts and forecast out by then) count as storm alerts, the rest as quiet.  Each
+strategy is replayed once per minute of offset between the start of the replay and the rule's first tick (up to --rate),
+and the results pooled, so a lucky phase doesn't flatter it.
+"""
+
+import argparse
+import sys
+
+from run_bench import percentile
+from standins import install, read_corpus
+
+STRATEGIES = ["fixed", "skip", "adaptive"]
+
+def load_storm():
+    import json
+    import orm
+    import scheduler
+    alerts = sorted(orm.parse_event_timestamp(a["issue_datetime"]) for a in json.loads(read_corpus("alerts.json")))
+    forecast = orm.ForecastObject.from_short_forecast(read_corpus("3-day-geomag-forecast.txt").replace("\r", ""))
+    return alerts, scheduler.outlook_from_forecast(forecast)
+
+def simulate(strategy, alerts, outlook, start, end, rate):
+    import scheduler
+    state = {}
+    names = list(scheduler.FEEDS)
+    polled = {name: start - 1 for name in names}
+    tick = rate
+    now = start
+    invocations = fetches = 0
+    latencies = []
+    forecast_latency = None
+    while now < end:
+        invocations += 1
+        stages = names if strategy == "fixed" else scheduler.due(state, names, now)
+        results = {}
+        found = []
+        fresh_outlook = None
+        for name in stages:
+            fetches += 1
+            since = polled[name]
+            if name == "events":
+                found = [t for t in alerts if since < t <= now]
+                latencies.extend((t, now - t) for t in found)
+                results[name] = bool(found)
+            elif name == "short-term forecast":
+                results[name] = since < outlook["issued"] <= now
+                if results[name]:
+                    fresh_outlook = outlook
+                    forecast_latency = now - outlook["issued"]
+            else:
+                results[name] = since < start
+            polled[name] = now
+        wait = scheduler.plan(state, results, now, alerts=found, outlook=fresh_outlook)
+        if strategy == "adaptive":
+            # The rule only fires on whole minutes, and keeps its old rate until the scheduler changes it.
+            tick = max(1, round(wait / 60)) * 60
+        now += tick
+    return invocations, fetches, latencies, forecast_latency
+
+def storm_alerts(alerts, outlook):
+    import scheduler
+    storm = set()
+    for t in alerts:
+        state = {"alerts": [a for a in alerts if a <= t], "outlook": outlook if outlook["issued"] <= t else None}
+        if scheduler.activity_level(state, t) >= 2:
+            storm.add(t)
+    return storm
+
+def pooled(strategy, alerts, outlook, start, end, rate):
+    runs = [simulate(strategy, alerts, outlook, start + offset, end, rate) for offset in range(0, rate, 60)]
+    storm = storm_alerts(alerts, outlook)
+    quiet_latencies = [l for run in runs for t, l in run[2] if t not in storm]
+    storm_latencies = [l for run in runs for t, l in run[2] if t in storm]
+    forecasts = [run[3] for run in runs if run[3] is not None]
+    return {
+        "invocations": sum(run[0] for run in runs) / len(runs),
+        "fetches": sum(run[1] for run in runs) / len(runs),
+        "quiet_p50": percentile(quiet_latencies, 50),
+        "quiet_max": max(quiet_latencies),
+        "storm_p50": percentile(storm_latencies, 50),
+        "storm_max": max(storm_latencies),
+        "storm_alerts": len(storm),
+        "forecast_latency": sum(forecasts) / len(forecasts),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=int, default=5, help="minutes between ticks of the fixed rule (default 5, as deployed)")
+    parser.add_argument("--before", type=float, default=24, help="hours of replay before the first alert")
+    parser.add_argument("--after", type=float, default=48, help="hours of replay after the last alert")
+    args = parser.parse_args()
+    install()
+    alerts, outlook = load_storm()
+    start = int(alerts[0] - args.before * 3600)
+    end = int(alerts[-1] + args.after * 3600)
+    print(f"{len(alerts)} alerts over {(alerts[-1] - alerts[0]) / 3600:.1f}h, replayed over {(end - start) / 3600:.0f}h; fixed rule rate({args.rate} minutes)")
+    print(f"{'':<10}{'':>13}{'':>9}{'quiet alerts':>18}{'storm alerts':>18}")
+    print(f"{'strategy':<10}{'invocations':>13}{'fetches':>9}{'p50':>9}{'max':>9}{'p50':>9}{'max':>9}{'forecast':>10}")
+    for strategy in STRATEGIES:
+        r = pooled(strategy, alerts, outlook, start, end, args.rate * 60)
+        print(f"{strategy:<10}{r['invocations']:>13.0f}{r['fetches']:>9.0f}{r['quiet_p50'] / 60:>8.1f}m{r['quiet_max'] / 60:>8.1f}m{r['storm_p50'] / 60:>8.1f}m{r['storm_max'] / 60:>8.1f}m{r['forecast_latency'] / 60:>9.1f}m")
+    print(f"Latencies are minutes from issue to first fetch ({r['storm_alerts']} storm alerts); forecast is the mean for the 3-day forecast.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Offline stand-ins shared by the benchmark and load-test scripts: recorded NOAA feeds served through a requests adapter,
+a fake SNS client, and the in-memory DynamoDB tables from localstore.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+
+CORPUS_FILES = {
+    "https://services.swpc.noaa.gov/products/alerts.json": "alerts.json",
+    "https://services.swpc.noaa.gov/text/3-day-geomag-forecast.txt": "3-day-geomag-forecast.txt",
+    "https://services.swpc.noaa.gov/text/27-day-outlook.txt": "27-day-outlook.txt",
+}
+
+def setup_environment():
+    # Just enough for the modules to import; nothing here ever reaches AWS.
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("STACK_NAME", "carrington-local")
+    os.environ.setdefault("PAGE_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:page")
+    os.environ.setdefault("TEXT_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:text")
+    os.environ.setdefault("EMAIL_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:email")
+    os.environ.setdefault("LAMBDA_TASK_ROOT", REPO_ROOT)
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+def read_corpus(filename, mode="r"):
+    with open(os.path.join(CORPUS_DIR, filename), mode) as f:
+        return f.read()
+
+class FakeSNS(object):
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.published = []
+        self.lock = threading.Lock()
+
+    def publish(self, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.published.append(kwargs)
+        return {"MessageId": str(len(self.published))}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            for entry in PublishBatchRequestEntries:
+                self.published.append(dict(TopicArn=TopicArn, **{k: v for k, v in entry.items() if k != "Id"}))
+        return {"Successful": [{"Id": e["Id"], "MessageId": e["Id"]} for e in PublishBatchRequestEntries], "Failed": []}
+
+def corpus_adapter(latency=0, files=None):
+    from requests.adapters import BaseAdapter
+    from requests.models import Response
+    from requests.structures import CaseInsensitiveDict
+
+    files = files if files else CORPUS_FILES
+    bodies = {url: read_corpus(name, "rb") for url, name in files.items()}
+
+    class CorpusAdapter(BaseAdapter):
+        """
+        Serves the recorded feeds, honouring If-None-Match the way the SWPC servers do.
+        """
+        def __init__(self):
+            super().__init__()
+            self.bodies = bodies
+            self.latency = latency
+            self.requests = 0
+
+        def send(self, request, **kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+            self.requests += 1
+            body = self.bodies[request.url]
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            response = Response()
+            response.url = request.url
+            response.request = request
+            response.headers = CaseInsensitiveDict({"ETag": etag})
+            if request.headers.get("If-None-Match") == etag:
+                response.status_code = 304
+                response._content = b""
+            else:
+                response.status_code = 200
+                response._content = body
+                response.encoding = "utf-8"
+            return response
+
+        def close(self):
+            pass
+
+    return CorpusAdapter()
+
+def install(ddb_latency=0, sns_latency=0, http_latency=0):
+    """
+    Points orm, feeds and handlers at the stand-ins and returns (database, sns, adapter).
+    """
+    setup_environment()
+    import feeds
+    import handlers
+    import orm
+    from localstore import LocalDatabase
+
+    database = LocalDatabase(latency=ddb_latency)
+    database.install(orm.EventObject, orm.ForecastObject, orm.StateObject, orm.SubscriberObject, orm.RollupObject)
+    sns = FakeSNS(latency=sns_latency)
+    handlers.SNS = sns
+    adapter = corpus_adapter(latency=http_latency)
+    feeds.session().mount("https://services.swpc.noaa.gov/", adapter)
+    return database, sns, adapter
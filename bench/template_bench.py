@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+First-render (cold container) and steady-state render latency of the HTML pages, compiling the Jinja templates from
+source versus loading the modules src/templates.py precompiles at build time.
+
+Each cold measurement runs in a fresh interpreter against a throwaway task root, so nothing is cached from earlier runs
+apart from whatever the OS has in its page cache.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from standins import REPO_ROOT, SRC_DIR, setup_environment
+
+PAGES = ["index.html", "map.html", "events/list.html", "events/list_code.html", "events/view.html", "events/search.html"]
+
+# Runs inside the child interpreter; prints {page: [first render ms, steady-state ms]} as JSON.
+CHILD = r"""
+import json, sys, time
+from sneks.sam import ui_stuff
+import assets, templates
+templates.install()
+assets.install()
+pages = {pages!r}
+iterations = {iterations!r}
+params = dict(base_path="/", static_base="/static", events=[], chain=[], code="WARK04", q="", total=0,
+              _event=dict(space_weather_message_code="WARK04", serial_number=1, pretty_timestamp="2024-05-10 12:00 UTC", message="Space Weather Message Code: WARK04"))
+results = {{}}
+for page in pages:
+    start = time.perf_counter()
+    ui_stuff.env.get_template(page).render(**params)
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(iterations):
+        ui_stuff.env.get_template(page).render(**params)
+    steady = (time.perf_counter() - start) / iterations
+    results[page] = [first * 1000, steady * 1000]
+print(json.dumps(results))
+"""
+
+def make_root(precompiled):
+    import templates
+    root = tempfile.mkdtemp(prefix="carrington-templates-")
+    os.symlink(os.path.join(REPO_ROOT, "jinja_templates"), os.path.join(root, "jinja_templates"))
+    if precompiled:
+        templates.compile_all(templates.compiled_dir(root), os.path.join(REPO_ROOT, "jinja_templates"))
+    return root
+
+def run_case(root, iterations):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC_DIR
+    env["LAMBDA_TASK_ROOT"] = root
+    script = CHILD.format(pages=PAGES, iterations=iterations)
+    result = subprocess.run([sys.executable, "-c", script], cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="cold starts per mode; the median is reported")
+    parser.add_argument("--iterations", type=int, default=200, help="steady-state renders per page")
+    args = parser.parse_args()
+    setup_environment()
+
+    roots = {"source": make_root(False), "compiled": make_root(True)}
+    try:
+        results = {}
+        for mode, root in roots.items():
+            runs = [run_case(root, args.iterations) for _ in range(args.repeat)]
+            results[mode] = {page: [sorted(r[page][i] for r in runs)[len(runs) // 2] for i in range(2)] for page in PAGES}
+    finally:
+        for root in roots.values():
+            shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{'page':<24}{'first src':>11}{'first cmp':>11}{'steady src':>12}{'steady cmp':>12}   (ms)")
+    totals = [0.0] * 4
+    for page in PAGES:
+        row = results["source"][page][:1] + results["compiled"][page][:1] + results["source"][page][1:] + results["compiled"][page][1:]
+        totals = [t + v for t, v in zip(totals, row)]
+        print(f"{page:<24}{row[0]:>11.2f}{row[1]:>11.2f}{row[2]:>12.3f}{row[3]:>12.3f}")
+    print(f"{'total':<24}{totals[0]:>11.2f}{totals[1]:>11.2f}{totals[2]:>12.3f}{totals[3]:>12.3f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Running Ap forecast accuracy, scored against the "Observed Ap" line of each 3-day forecast.
+
+When a 3-day forecast arrives with a new observed Ap value, every 3-day and 27-day prediction for that day is pulled from the
+forecast time series (see timeseries.py) and its error is folded into per-(product, lead time) running sums kept in one
+StateTable item.  Nothing is ever rescanned, and reading the stats back is a single GetItem.
+
+SWPC only publishes an observed value for Ap, so Kp forecasts aren't scored.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from orm import StateObject
+import timeseries
+
+ACCURACY_KEY = "forecast_accuracy"
+PRODUCT_NAMES = {timeseries.SHORT: "short", timeseries.MONTH: "month"}
+SUMS = ["count", "sum_err", "sum_abs", "sum_sq"]
+
+def score(series, days):
+    """
+    Errors (predicted - observed) of every Ap prediction for the given observed days.
+    Returns {(product, lead_days): {"count", "sum_err", "sum_abs", "sum_sq"}}.
+    """
+    observed = series.select(timeseries.AP, product=timeseries.OBSERVED)
+    observed = observed[np.isin(observed["day"], days)]
+    if not len(observed):
+        return {}
+    # If a day was somehow observed twice, the latest issue wins.
+    observed = observed[np.argsort(observed["issued"], kind="stable")]
+    obs_days, last = np.unique(observed["day"][::-1], return_index=True)
+    obs_values = observed["value"][::-1][last]
+
+    predicted = series.select(timeseries.AP)
+    predicted = predicted[np.isin(predicted["product"], list(PRODUCT_NAMES)) & np.isin(predicted["day"], obs_days)]
+    if not len(predicted):
+        return {}
+    errors = predicted["value"].astype(np.float64) - obs_values[np.searchsorted(obs_days, predicted["day"])]
+    leads = predicted["day"].astype(np.int64) - predicted["issued"] // 86400
+
+    groups, inverse = np.unique(np.stack([predicted["product"].astype(np.int64), leads]), axis=1, return_inverse=True)
+    inverse = inverse.ravel()
+    sums = {
+        "count": np.bincount(inverse),
+        "sum_err": np.bincount(inverse, weights=errors),
+        "sum_abs": np.bincount(inverse, weights=np.abs(errors)),
+        "sum_sq": np.bincount(inverse, weights=errors ** 2),
+    }
+    return {(int(groups[0][i]), int(groups[1][i])): {k: float(sums[k][i]) for k in SUMS} for i in range(groups.shape[1])}
+
+def _merge(stats, scored):
+    for (product, lead), sums in scored.items():
+        by_lead = stats.setdefault(PRODUCT_NAMES[product], {})
+        current = by_lead.setdefault(str(lead), {k: 0 for k in SUMS})
+        for k in SUMS:
+            current[k] = current[k] + sums[k]
+    return stats
+
+def record_observations(rows):
+    """
+    Called with the rows of each newly ingested 3-day forecast.  Scores any observed days not already scored.
+    """
+    state = StateObject.get_state(ACCURACY_KEY)
+    scored_through = state.get("scored_through", -1)
+    observed = rows[(rows["kind"] == timeseries.AP) & (rows["product"] == timeseries.OBSERVED) & (rows["day"] > scored_through)]
+    if not len(observed):
+        return 0
+    days = np.unique(observed["day"])
+    scored = score(timeseries.load_range(days[0], days[-1]), days)
+    state["stats"] = _merge(state.get("stats", {}), scored)
+    state["scored_through"] = int(days[-1])
+    state.save(force=True)
+    return sum(int(s["count"]) for s in scored.values())
+
+def rebuild(first_year=2000):
+    """
+    One-off: rescores every observed day in the forecast time series from scratch.
+    """
+    state = StateObject.get_state(ACCURACY_KEY)
+    state["stats"] = {}
+    state["scored_through"] = -1
+    series = timeseries.load_range(timeseries.day_number(f"{first_year}/01/01"), timeseries.day_number(f"{datetime.utcnow().year}/12/31"))
+    observed = series.select(timeseries.AP, product=timeseries.OBSERVED)
+    if len(observed):
+        days = np.unique(observed["day"])
+        state["stats"] = _merge({}, score(series, days))
+        state["scored_through"] = int(days[-1])
+    state.save(force=True)
+    return state
+
+def summary():
+    state = StateObject.load(state_key=ACCURACY_KEY)
+    stats = state.get("stats", {}) if state else {}
+    results = {}
+    for product, by_lead in stats.items():
+        rows = []
+        for lead in sorted(by_lead, key=int):
+            s = by_lead[lead]
+            count = s["count"]
+            rows.append({
+                "lead_days": int(lead),
+                "count": int(count),
+                "bias": s["sum_err"] / count,
+                "mae": s["sum_abs"] / count,
+                "rmse": (s["sum_sq"] / count) ** 0.5,
+            })
+        results[product] = rows
+    return {"kind": "ap", "scored_through": timeseries.day_string(state["scored_through"]) if state and state.get("scored_through", -1) >= 0 else None, "by_lead": results}
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Content-hashed, pre-compressed copies of everything under static/, so browsers can cache them forever.
+
+The build writes them into static/dist, along with a manifest mapping each original path to its hashed name:
+
+    python3 src/assets.py build build     # static/ of the bundle in build/ -> build/static/dist
+    python3 src/assets.py build           # same for the checkout, for running locally
+
+Each file becomes static/dist/<dir>/<name>.<hash>.<ext>, plus .gz (and .br, if the brotli module is installed) variants
+for text formats when compressing actually helps.  Templates link to them through asset_url, and get_asset serves them
+with an immutable Cache-Control, an ETag, and whichever encoding the browser accepts.  Paths that aren't in the
+manifest (or a bundle built without the step) fall back to the plain static/ URLs.
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST_DIR = os.path.join("static", "dist")
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 12
+COMPRESSIBLE = {"css", "js", "json", "svg", "txt", "html", "webmanifest", "ico"}
+# A compressed variant has to save at least this fraction of the original to be worth a Content-Encoding.
+MIN_SAVING = 0.1
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+HASH_PATTERN = re.compile(r"\.[0-9a-f]{%d}(?=\.[^./]+$|$)" % HASH_LENGTH)
+# Preferred first when the browser accepts several.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+def hashed_name(path, digest):
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        # mtime=0 so rebuilding identical content gives identical bytes.
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+def build(root="."):
+    """
+    Fingerprints and compresses everything under root/static into root/static/dist and writes the manifest.
+    Returns the manifest.
+    """
+    source = os.path.join(root, "static")
+    target = os.path.join(root, DIST_DIR)
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(source):
+        if os.path.abspath(dirpath) == os.path.abspath(source):
+            dirnames[:] = [d for d in dirnames if d != "dist"]
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(path, source)
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+            output = hashed_name(relative, digest)
+            entry = {"file": "/".join([DIST_DIR.replace(os.sep, "/"), output.replace(os.sep, "/")]), "hash": digest, "size": len(data), "encodings": {}}
+            variants = {"": data}
+            if filename.rsplit(".", 1)[-1].lower() in COMPRESSIBLE:
+                for encoding, suffix in ENCODINGS:
+                    if encoding == "br" and brotli is None:
+                        continue
+                    compressed = compress(data, encoding)
+                    if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                        variants[suffix] = compressed
+                        entry["encodings"][encoding] = len(compressed)
+            for suffix, body in variants.items():
+                out_path = os.path.join(target, output + suffix)
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                with open(out_path, "wb") as f:
+                    f.write(body)
+            manifest["static/" + relative.replace(os.sep, "/")] = entry
+    os.makedirs(target, exist_ok=True)
+    with open(os.path.join(target, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+MANIFEST = None
+# hashed file -> (original path, manifest entry)
+FILES = None
+
+def get_manifest():
+    global MANIFEST, FILES
+    if MANIFEST is None:
+        try:
+            with open(os.path.join(os.environ["LAMBDA_TASK_ROOT"], DIST_DIR, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        FILES = {e["file"]: (original, e) for original, e in manifest.items()}
+        MANIFEST = manifest
+    return MANIFEST
+
+def asset_url(static_base, path):
+    """
+    The hashed URL for a file under static/, for use in templates:
+        {{ asset_url(static_base, "static/css/custom.css") }}
+    """
+    path = path.lstrip("/")
+    entry = get_manifest().get(path)
+    return f"{static_base or ''}/{entry['file'] if entry else path}"
+
+def install(env=None):
+    """
+    Makes asset_url available to every template rendered through env (sneks' shared environment by default).
+    """
+    if env is None:
+        from sneks.sam import ui_stuff
+        env = ui_stuff.env
+    env.globals["asset_url"] = asset_url
+
+def header(event, name):
+    for k, v in ((event or {}).get("headers") or {}).items():
+        if k.lower() == name:
+            return v
+    return None
+
+def accepted_encodings(accept_encoding):
+    """
+    The content codings a request accepts (anything listed without q=0).
+    """
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+def get_asset(filename, event=None, **kwargs):
+    from sneks.sam import events, ui_stuff
+    from sneks.sam.response_core import make_response, redirect
+    # Only names in the manifest are served, so a request can never reach an arbitrary path on disk.
+    manifest = get_manifest()
+    found = FILES.get(filename.lstrip("/"))
+    if not found:
+        # A page cached (or snapshotted) before a deploy can still ask for an old hash; send it to the current file.
+        dist_prefix = DIST_DIR.replace(os.sep, "/") + "/"
+        original = "static/" + HASH_PATTERN.sub("", filename.lstrip("/"))[len(dist_prefix):]
+        if filename.lstrip("/").startswith(dist_prefix) and original in manifest:
+            return redirect(asset_url(events.static_path(event), original))
+        return make_response("404!!1!", code=404)
+    original, entry = found
+    accepted = accepted_encodings(header(event, "accept-encoding"))
+    encoding, suffix = next(((e, s) for e, s in ENCODINGS if e in entry["encodings"] and e in accepted), (None, ""))
+    etag = '"{}{}"'.format(entry["hash"], "-" + encoding if encoding else "")
+    headers = {
+        "Content-Type": ui_stuff.get_content_type(original),
+        "Cache-Control": CACHE_CONTROL,
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = header(event, "if-none-match") or ""
+    if entry["hash"] in if_none_match or if_none_match.strip() == "*":
+        return make_response("", code=304, headers=headers, base64=False, prettify_html=False)
+    with open(os.path.join(os.environ["LAMBDA_TASK_ROOT"], entry["file"] + suffix), "rb") as f:
+        body = f.read()
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if encoding or headers["Content-Type"] in ui_stuff.binary_types:
+        return make_response(base64.b64encode(body).decode("utf-8"), headers=headers, base64=True, prettify_html=False)
+    return make_response(body.decode("utf-8"), headers=headers, base64=False, prettify_html=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("root", nargs="?", default=".", help="directory containing static/")
+    args = parser.parse_args()
+    manifest = build(args.root)
+    original = sum(e["size"] for e in manifest.values())
+    smallest = sum(min([e["size"]] + list(e["encodings"].values())) for e in manifest.values())
+    print(f"Fingerprinted {len(manifest)} assets into {os.path.join(args.root, DIST_DIR)}: {original} bytes, {smallest} as sent to a browser accepting {', '.join(e for e, _ in ENCODINGS if e != 'br' or brotli)}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
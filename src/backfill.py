@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Backfills the EventTable from archives of past SWPC alert messages.
+
+Each archive is either a JSON list of alerts.json-style records ({"product_id", "issue_datetime", "message"}) or a JSONL file
+with one record per line.  Records are parsed with EventObject.parse_event across a process pool and written in rate-limited
+BatchWriteItem batches, then added to the search index and the /stats rollups.  Events that are already stored (from the cron,
+or an earlier backfill of an overlapping archive) are skipped: their chain links and versions are left as they are, and they
+aren't counted again.  Progress is checkpointed after every batch, so rerunning the same command resumes where it stopped.
+
+    python3 src/backfill.py archive-2017.jsonl archive-2018.json --processes 4 --rate 200
+    python3 src/backfill.py --local archive-2017.jsonl     # parse and write against the in-memory stand-in instead of AWS
+"""
+
+import argparse
+from collections import Counter
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import io
+from itertools import islice
+import json
+import os
+import sys
+import time
+import traceback
+
+CHECKPOINT_FILE = "backfill.checkpoint.json"
+LOCAL_CHECKPOINT_FILE = "backfill.local.checkpoint.json"
+
+def read_records(path, skip=0):
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for i, line in enumerate(f):
+                if i >= skip and line.strip():
+                    yield i, json.loads(line)
+    else:
+        with open(path) as f:
+            records = json.load(f)
+        for i, record in enumerate(records):
+            if i >= skip:
+                yield i, record
+
+def windows(iterable, size):
+    # Executor.map submits everything it's given up front, so feed it a bounded window at a time instead of a whole archive.
+    iterator = iter(iterable)
+    while True:
+        window = list(islice(iterator, size))
+        if not window:
+            return
+        yield window
+
+def parse_record(indexed_record):
+    # Runs in the worker processes, so it hands back plain dicts rather than EventObjects.
+    i, record = indexed_record
+    from orm import EventObject
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            obj = EventObject.parse_event(record)
+        return i, dict(obj), None
+    except:
+        return i, None, traceback.format_exc().strip().split("\n")[-1]
+
+class Checkpoint(object):
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def done(self, archive):
+        return self.state.get(os.path.abspath(archive), 0)
+
+    def update(self, archive, done):
+        self.state[os.path.abspath(archive)] = done
+        if self.path:
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+            os.replace(self.path + ".tmp", self.path)
+
+class RateLimiter(object):
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.start = time.perf_counter()
+        self.count = 0
+
+    def wait(self, n):
+        self.count += n
+        if self.per_second:
+            ahead = self.count / self.per_second - (time.perf_counter() - self.start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+class Stats(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.parsed = 0
+        self.written = 0
+        self.skipped = 0
+        self.failures = Counter()
+        self.events_with_unhandled = 0
+        self.unhandled_lines = Counter()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        print(f"Parsed {self.parsed} events, wrote {self.written} in {elapsed:.1f}s ({self.written / elapsed if elapsed else 0:.1f} events/sec).")
+        print(f"Already stored, skipped: {self.skipped}")
+        print(f"Parse failures: {sum(self.failures.values())}")
+        for message, count in self.failures.most_common(10):
+            print(f"  {count:>6}  {message}")
+        print(f"Events with unhandled lines: {self.events_with_unhandled} ({sum(self.unhandled_lines.values())} lines)")
+        for line, count in self.unhandled_lines.most_common(10):
+            print(f"  {count:>6}  {line}")
+
+def backfill_archive(archive, pool, checkpoint, limiter, stats, batch_size=25, write=None):
+    import chains
+    import rollups
+    import search
+    from orm import EventObject
+    write = write if write else EventObject.batch_save
+    done = checkpoint.done(archive)
+    if done:
+        print(f"Resuming {archive} after record {done}.")
+    batch = []
+    last_index = done - 1
+
+    def flush():
+        new = []
+        if batch:
+            # BatchWriteItem overwrites, so anything already stored is left out rather than replaced with this batch's view of
+            # its chain.
+            stored = {o.key_string for o in EventObject.batch_load([EventObject.key_from_string(o.key_string) for o in batch])}
+            new = list({o.key_string: o for o in batch if o.key_string not in stored}.values())
+            stats.skipped += len(batch) - len(new)
+            if new:
+                # Archives are in issue order, so each event's chain parent has already been written by an earlier batch.
+                relinked = chains.link(new)
+                limiter.wait(len(new) + len(relinked))
+                stats.written += write(new + relinked)
+                search.index_events(new)
+            batch.clear()
+        checkpoint.update(archive, last_index + 1)
+        if new:
+            # Only the events this batch actually added, so a backfill overlapping the cron's events doesn't count them again.
+            # Counted only once the checkpoint has moved past them (as scrape_events does with its high-water mark), so
+            # resuming after a crash can't count a batch twice.
+            rollups.record_events(new)
+
+    for window in windows(read_records(archive, skip=done), 4096):
+        for i, item, error in pool.map(parse_record, window, chunksize=64):
+            last_index = i
+            if error:
+                stats.failures[error] += 1
+                continue
+            stats.parsed += 1
+            unhandled = item.get("data", {}).get("unhandled_lines", [])
+            if unhandled:
+                stats.events_with_unhandled += 1
+                stats.unhandled_lines.update(unhandled)
+            batch.append(EventObject(item))
+            if len(batch) >= batch_size:
+                flush()
+    flush()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archives", nargs="+")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--rate", type=float, default=100, help="max events written per second (0 for unlimited)")
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--checkpoint", default=None, help=f"progress file (default {CHECKPOINT_FILE}, or {LOCAL_CHECKPOINT_FILE} with --local)")
+    parser.add_argument("--local", action="store_true", help="write to the in-memory DynamoDB stand-in instead of AWS")
+    args = parser.parse_args()
+
+    if args.local:
+        os.environ.setdefault("STACK_NAME", "carrington-local")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    import orm
+    if args.local:
+        # The stand-in lives with the benchmarks so it stays out of the Lambda bundle.
+        bench_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+        sys.path.insert(0, bench_dir)
+        from localstore import LocalDatabase
+        LocalDatabase().install(orm.EventObject, orm.StateObject, orm.RollupObject)
+
+    # A --local run mustn't mark archives as done for the real backfill.
+    checkpoint = Checkpoint(args.checkpoint or (LOCAL_CHECKPOINT_FILE if args.local else CHECKPOINT_FILE))
+    limiter = RateLimiter(args.rate)
+    stats = Stats()
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        for archive in args.archives:
+            backfill_archive(archive, pool, checkpoint, limiter, stats, batch_size=args.batch_size)
+    stats.report()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Links alerts that continue, extend or cancel an earlier alert into chains.
+
+SWPC follow-ups always carry the same message code as the event they refer to, plus one of "Continuation of Serial Number",
+"Extension to Serial Number" or "Cancel Serial Number".  At ingest each new event gets:
+    predecessors: every earlier event in its chain, oldest first
+    successors: every later event in its chain (appended to on the stored events as the chain grows)
+    chain_status: active, superseded (continued or extended by a later event), cancelled, or cancellation for the cancel notice
+so a view can fetch a whole chain with one BatchGetItem, and EventObject.is_active is a couple of lookups on the item itself.
+"""
+
+from orm import EventObject, CHAIN_ACTIVE, CHAIN_SUPERSEDED, CHAIN_CANCELLED, CHAIN_CANCELLATION
+
+LINKS = [
+    ("continuation_of_serial_number", CHAIN_SUPERSEDED),
+    ("extension_to_serial_number", CHAIN_SUPERSEDED),
+    ("cancel_serial_number", CHAIN_CANCELLED),
+]
+
+def parent_link(obj):
+    """
+    (parent key string, status the parent ends up with), or (None, None) if the event doesn't refer to an earlier one.
+    """
+    data = obj.get("data", {})
+    for field, status in LINKS:
+        if data.get(field, "").strip().isdigit():
+            return f"{obj['space_weather_message_code']}/{int(data[field])}", status
+    return None, None
+
+def _load_missing(by_key, key_strings):
+    missing = [k for k in key_strings if k not in by_key]
+    if missing:
+        for obj in EventObject.batch_load([EventObject.key_from_string(k) for k in missing]):
+            by_key[obj.key_string] = obj
+
+def link(objs):
+    """
+    Fills in the chain attributes on newly ingested events (in issue order) and returns the already-stored events whose
+    chain attributes changed as a result, which need saving along with the new ones.
+    """
+    by_key = {o.key_string: o for o in objs}
+    new_keys = set(by_key)
+    for obj in objs:
+        obj.setdefault("predecessors", [])
+        obj.setdefault("successors", [])
+        obj.setdefault("chain_status", CHAIN_ACTIVE)
+
+    # Two batch reads at most: the stored parents, then whichever of their ancestors aren't already in hand.
+    parents = {o.key_string: parent_link(o) for o in objs}
+    _load_missing(by_key, [p for p, _ in parents.values() if p])
+    _load_missing(by_key, [a for p, _ in parents.values() if p in by_key for a in by_key[p].get("predecessors", [])])
+
+    changed = {}
+    for obj in sorted(objs, key=lambda o: o["timestamp"]):
+        parent_key, status = parents[obj.key_string]
+        if not parent_key:
+            continue
+        parent = by_key.get(parent_key)
+        if parent is None:
+            print(f"{obj.key_string} refers to {parent_key}, which isn't stored; starting a new chain.")
+            continue
+        obj["predecessors"] = list(parent.get("predecessors", [])) + [parent_key]
+        if status == CHAIN_CANCELLED:
+            obj["chain_status"] = CHAIN_CANCELLATION
+        parent["chain_status"] = status
+        for key in obj["predecessors"]:
+            ancestor = by_key.get(key)
+            if ancestor is None:
+                continue
+            successors = ancestor.setdefault("successors", [])
+            if obj.key_string not in successors:
+                successors.append(obj.key_string)
+            changed[key] = ancestor
+    return [a for k, a in changed.items() if k not in new_keys]
+
+def load_chain(obj):
+    """
+    Every event in obj's chain, including obj, oldest first.
+    """
+    keys = list(obj.get("predecessors", [])) + list(obj.get("successors", []))
+    if not keys:
+        return [obj]
+    chain = EventObject.batch_load([EventObject.key_from_string(k) for k in keys]) + [obj]
+    return sorted(chain, key=lambda o: (o["timestamp"], o["serial_number"]))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Item-size report for the compact storage format (COMPACT_STORAGE), and a migration that rewrites existing items in it.
+
+    python3 src/compact.py report                 # sizes of every stored event and forecast, as stored and as they'd be compacted
+    python3 src/compact.py migrate --table events # rewrite the events that aren't compact yet
+    python3 src/compact.py report --local --events bench/corpus/alerts.json   # same report for an alerts.json-style file
+
+Sizes follow DynamoDB's item size rules (attribute names plus values; numbers approximated from their digits), which is what
+read/write capacity and the 400KB item limit are charged against.
+"""
+
+import argparse
+from decimal import Decimal
+import json
+import os
+import sys
+
+def attribute_size(value):
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (int, float, Decimal)):
+        digits = len(str(abs(value)).replace(".", "").lstrip("0")) or 1
+        return 1 + (digits + 1) // 2
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if hasattr(value, "value") and isinstance(value.value, (bytes, bytearray)):
+        return len(value.value)
+    if isinstance(value, dict):
+        return 3 + sum(len(str(k).encode("utf-8")) + attribute_size(v) + 1 for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 3 + sum(attribute_size(v) + 1 for v in value)
+    return len(str(value).encode("utf-8"))
+
+def item_size(item):
+    return sum(len(k.encode("utf-8")) + attribute_size(v) for k, v in item.items())
+
+def encodings(obj):
+    """
+    (size in the regular format, size in the compact format) for one object.
+    """
+    import orm
+    saved = orm.COMPACT_STORAGE
+    try:
+        orm.COMPACT_STORAGE = False
+        plain = obj._item_to_save()
+        orm.COMPACT_STORAGE = True
+        compact = obj._item_to_save()
+    finally:
+        orm.COMPACT_STORAGE = saved
+    return item_size(plain), item_size(compact)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+def report(name, objects):
+    sizes = [encodings(o) for o in objects]
+    if not sizes:
+        print(f"{name}: no items.")
+        return
+    plain = [p for p, _ in sizes]
+    compact = [c for _, c in sizes]
+    print(f"{name}: {len(sizes)} items")
+    print(f"  {'':<10}{'total':>12}{'mean':>10}{'p95':>10}{'max':>10}")
+    for label, values in [("regular", plain), ("compact", compact)]:
+        print(f"  {label:<10}{sum(values):>12}{sum(values) // len(values):>10}{percentile(values, 0.95):>10}{max(values):>10}")
+    print(f"  saved {100 * (1 - sum(compact) / sum(plain)):.1f}% ({sum(plain) - sum(compact)} bytes)")
+
+def is_compact(obj):
+    return any(dict.__contains__(obj, k + "_z") for k in obj._COMPRESSED)
+
+def migrate(cls):
+    import orm
+    orm.COMPACT_STORAGE = True
+    pending = [o for o in cls.scan_all() if not is_compact(o)]
+    written = cls.batch_save(pending)
+    print(f"Rewrote {written} {cls.__name__} items in the compact format.")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["report", "migrate"])
+    parser.add_argument("--table", choices=["events", "forecasts", "all"], default="all")
+    parser.add_argument("--local", action="store_true", help="use the in-memory DynamoDB stand-in instead of AWS")
+    parser.add_argument("--events", help="with --local, load events from an alerts.json-style file first")
+    parser.add_argument("--forecast", action="append", default=[], help="with --local, load a 3-day or 27-day forecast text file first")
+    args = parser.parse_args()
+
+    if args.local:
+        os.environ.setdefault("STACK_NAME", "carrington-local")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    import orm
+    if args.local:
+        # The stand-in lives with the benchmarks so it stays out of the Lambda bundle.
+        bench_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+        sys.path.insert(0, bench_dir)
+        from localstore import LocalDatabase
+        LocalDatabase().install(orm.EventObject, orm.ForecastObject)
+        if args.events:
+            with open(args.events) as f:
+                orm.EventObject.batch_save([orm.EventObject.parse_event(e) for e in json.load(f)])
+        for path in args.forecast:
+            with open(path) as f:
+                text = f.read().replace("\r", "")
+            if "27-day" in text.split("\n")[0]:
+                orm.ForecastObject.from_month_forecast(text, save=True)
+            else:
+                orm.ForecastObject.from_short_forecast(text, save=True)
+
+    classes = {"events": [orm.EventObject], "forecasts": [orm.ForecastObject], "all": [orm.EventObject, orm.ForecastObject]}[args.table]
+    for cls in classes:
+        if args.command == "report":
+            report(cls.__name__, list(cls.scan_all()))
+        else:
+            migrate(cls)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from orm import StateObject
+
+# Shared across invocations in a warm container so we aren't paying for a new TLS handshake on every fetch.
+SESSION = None
+
+STATS = {}
+_LOCK = threading.Lock()
+
+def session():
+    global SESSION
+    with _LOCK:
+        if SESSION is None:
+            SESSION = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            SESSION.mount("https://", adapter)
+            SESSION.mount("http://", adapter)
+    return SESSION
+
+def _record(**counts):
+    with _LOCK:
+        for k in counts:
+            STATS[k] += counts[k]
+
+def reset_stats():
+    STATS.clear()
+    STATS.update({
+        "fetched": 0,
+        "not_modified": 0,
+        "bytes_fetched": 0,
+        "bytes_skipped": 0,
+    })
+
+def stats_summary():
+    return f"Feeds fetched: {STATS['fetched']} ({STATS['bytes_fetched']} bytes), not modified: {STATS['not_modified']} ({STATS['bytes_skipped']} bytes skipped)"
+
+reset_stats()
+
+def _state_key(url):
+    return f"feed:{url}"
+
+class FeedResult(object):
+    def __init__(self, url, state, response):
+        self.url = url
+        self.state = state
+        self.response = response
+
+    @property
+    def changed(self):
+        return self.response.status_code != 304
+
+    @property
+    def text(self):
+        return self.response.text
+
+    def json(self):
+        return self.response.json()
+
+    def commit(self):
+        # Only called once the caller has actually processed the body.
+        # If we stored the validators before that and the processing blew up, the next run would get a 304 and never retry.
+        if not self.changed:
+            return
+        headers = self.response.headers
+        self.state["etag"] = headers.get("ETag")
+        self.state["last_modified"] = headers.get("Last-Modified")
+        self.state["content_length"] = len(self.response.content)
+        self.state["fetched_at"] = int(time.time())
+        self.state.save(force=True)
+
+def fetch(url, timeout=10):
+    state = StateObject.get_state(_state_key(url))
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    with metrics.span("fetch"):
+        response = session().get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        _record(not_modified=1, bytes_skipped=int(state.get("content_length", 0)))
+        metrics.count("fetch.not_modified")
+        print(f"{url} not modified since last fetch.")
+    else:
+        response.raise_for_status()
+        _record(fetched=1, bytes_fetched=len(response.content))
+        metrics.count("fetch.bytes", len(response.content))
+    return FeedResult(url, state, response)
@@ -1,8 +1,97 @@
-import io
+"""
+Captures stdout, stderr and root logging for the length of a with block, while still passing everything through.
+
+Each stream is kept in a RingBuffer capped at max_bytes (GRABBER_MAX_BYTES, default 64KB; 0 for no cap): the first half
+of the cap is kept from the start of the run and the rest from the end, with a marker in between saying how much was
+dropped.  A sink (any object with write(), e.g. an open file) also gets every write as it happens, uncapped.
+"""
+
 import logging
+import os
 import sys
+import threading
 import time
-import traceback
+
+import metrics
+
+MAX_BYTES = int(os.environ.get("GRABBER_MAX_BYTES", 64 * 1024))
+
+def _size(text):
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+class RingBuffer(object):
+    def __init__(self, max_bytes=None):
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.head_bytes = self.max_bytes // 2
+        self.tail_bytes = self.max_bytes - self.head_bytes
+        self.lock = threading.Lock()
+        self.head = []
+        self.head_size = 0
+        self.tail = []
+        self.tail_size = 0
+        self.dropped = 0
+
+    def write(self, text):
+        if not text:
+            return 0
+        written = len(text)
+        size = _size(text)
+        with self.lock:
+            if not self.max_bytes:
+                self.head.append(text)
+                self.head_size += size
+                return written
+            room = self.head_bytes - self.head_size
+            if room > 0:
+                if size <= room:
+                    self.head.append(text)
+                    self.head_size += size
+                    return written
+                kept = _clip(text, room, from_end=False)
+                self.head.append(kept)
+                self.head_size += _size(kept)
+                text = text[len(kept):]
+                size = _size(text)
+            self.tail.append(text)
+            self.tail_size += size
+            # Trimming on every write would cost a slice per print; letting the tail run to twice its share and then
+            # cutting it back in one go keeps writes cheap, at the price of holding up to 1.5x max_bytes.
+            if self.tail_size > 2 * self.tail_bytes:
+                self._trim()
+        return written
+
+    def _trim(self):
+        if self.tail_size <= self.tail_bytes:
+            return
+        tail = "".join(self.tail)
+        kept = _clip(tail, self.tail_bytes, from_end=True)
+        kept_size = _size(kept)
+        self.dropped += self.tail_size - kept_size
+        self.tail = [kept]
+        self.tail_size = kept_size
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        with self.lock:
+            self._trim()
+            head = "".join(self.head)
+            tail = "".join(self.tail)
+            dropped = self.dropped
+        if not dropped:
+            return head + tail
+        return f"{head}\n[... {dropped} bytes truncated ...]\n{tail}"
+
+def _clip(text, limit, from_end):
+    """
+    The longest start (or end) of text that fits in limit bytes, without splitting a character.
+    """
+    if text.isascii():
+        return text[len(text) - limit:] if from_end else text[:limit]
+    encoded = text.encode("utf-8")
+    encoded = encoded[len(encoded) - limit:] if from_end else encoded[:limit]
+    return encoded.decode("utf-8", "ignore")
 
 class Tee(object):
     def __init__(self, *args):
@@ -13,26 +102,33 @@ class Tee(object):
             destination.write(*args, **kwargs)
 
     def flush(self, *args, **kwargs):
-        pass
+        for destination in self.destinations:
+            flush = getattr(destination, "flush", None)
+            if flush:
+                flush()
 
 class Grabber(object):
-    def __init__(self):
+    def __init__(self, max_bytes=None, sink=None):
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.sink = sink
         self.stdout = None
         self.stderr = None
         self.logs = None
         self.duration = 0
+        self.truncated = 0
 
     def __enter__(self):
         self._stdout_original = sys.stdout
         self._stderr_original = sys.stderr
-        self._stdout_capture = io.StringIO()
-        self._stderr_capture = io.StringIO()
-        self._stdout_tee = Tee(self._stdout_original, self._stdout_capture)
-        self._stderr_tee = Tee(self._stderr_original, self._stderr_capture)
+        self._stdout_capture = RingBuffer(self.max_bytes)
+        self._stderr_capture = RingBuffer(self.max_bytes)
+        extra = (self.sink,) if self.sink else ()
+        self._stdout_tee = Tee(self._stdout_original, self._stdout_capture, *extra)
+        self._stderr_tee = Tee(self._stderr_original, self._stderr_capture, *extra)
         sys.stdout = self._stdout_tee
         sys.stderr = self._stderr_tee
-        self._logging_capture = io.StringIO()
-        self._logging_handler = logging.StreamHandler(self._logging_capture)
+        self._logging_capture = RingBuffer(self.max_bytes)
+        self._logging_handler = logging.StreamHandler(Tee(self._logging_capture, *extra))
         self._logging_handler.setLevel(logging.DEBUG)
         self._logging_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
         logging.getLogger().addHandler(self._logging_handler)
@@ -40,15 +136,23 @@ class Grabber(object):
 
     def __exit__(self, *args):
         self.end_time = time.perf_counter()
-        self.stdout = self._stdout_capture.getvalue()
-        self.stderr = self._stderr_capture.getvalue()
-        self.logs = self._logging_capture.getvalue()
         sys.stdout = self._stdout_original
         sys.stderr = self._stderr_original
         logging.getLogger().removeHandler(self._logging_handler)
-        self._stdout_capture.close()
-        self._stderr_capture.close()
-        self._logging_capture.close()
+        # Anything still holding the tees (a worker thread mid-print, or a Grabber entered after this one) carries on
+        # writing to the original streams rather than into a capture that's been read.
+        self._stdout_tee.destinations = (self._stdout_original,)
+        self._stderr_tee.destinations = (self._stderr_original,)
+        self._stdout_tee.flush()
+        self._stderr_tee.flush()
+        if self.sink and hasattr(self.sink, "flush"):
+            self.sink.flush()
+        self.stdout = self._stdout_capture.getvalue()
+        self.stderr = self._stderr_capture.getvalue()
+        self.logs = self._logging_capture.getvalue()
+        self.truncated = sum(c.dropped for c in (self._stdout_capture, self._stderr_capture, self._logging_capture))
+        if self.truncated:
+            metrics.count("capture.truncated_bytes", self.truncated)
         self.duration = self.end_time - self.start_time
 
     def info(self):
@@ -56,5 +160,6 @@ class Grabber(object):
             "stdout": self.stdout,
             "stderr": self.stderr,
             "logs": self.logs,
-            "duration": self.duration
+            "duration": self.duration,
+            "truncated": self.truncated,
         }
@@ -1,31 +1,44 @@
 import base64
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 import copy
 from datetime import datetime, timedelta
 from decimal import Decimal
 import hashlib
 import http.cookies
 import json
-from math import radians, degrees, cos, sin, asin, sqrt, fabs, log, tan, pi, atan2
 import os
 import random
-import requests
 import traceback
 import urllib
 import urllib.parse
 import uuid
 import time
 
-from sneks.sam import events
+from sneks.sam import events, ui_stuff
 from sneks.sam.response_core import make_response, redirect, ApiException
 from sneks.sam.decorators import register_path, returns_json, returns_html, returns_text
 from sneks.sam.exceptions import *
 from sneks.ddb import deepload
 
 from grabber import Grabber
-from orm import *
+import metrics
+from router import LazyKwargs
+from utils import lazy_import, log_function
 
-from utils import log_function
+# These pull in requests, the sneks ORM and a CloudFormation client, none of which a static or plain HTML request needs.
+# They load on first attribute access instead of at cold start.
+feeds = lazy_import("feeds")
+orm = lazy_import("orm")
+snapshots = lazy_import("snapshots")
+timeseries = lazy_import("timeseries")
+accuracy = lazy_import("accuracy")
+subscribers = lazy_import("subscribers")
+notifications = lazy_import("notifications")
+chains = lazy_import("chains")
+search = lazy_import("search")
+rollups = lazy_import("rollups")
+scheduler = lazy_import("scheduler")
 
 SHORT_FORECAST_URL = "https://services.swpc.noaa.gov/text/3-day-geomag-forecast.txt"
 MONTH_FORECAST_URL = "https://services.swpc.noaa.gov/text/27-day-outlook.txt"
@@ -47,7 +60,13 @@ def string_to_datetime(s):
 def sanitize(s):
     return s.replace('"',"")
 
-SNS = boto3.client("sns")
+SNS = None
+
+def sns_client():
+    global SNS
+    if SNS is None:
+        SNS = boto3.client("sns")
+    return SNS
 # TOPIC_ARN = os.environ["TOPIC_ARN"]
 PAGE_TOPIC_ARN = os.environ["PAGE_TOPIC_ARN"]
 TEXT_TOPIC_ARN = os.environ["TEXT_TOPIC_ARN"]
@@ -62,8 +81,9 @@ EMAIL_TOPIC_ARN = os.environ["EMAIL_TOPIC_ARN"]
 #         # MessageStructure='string',
 #     )
 
+@metrics.timed("sns.publish")
 def send_text(message):
-    response = SNS.publish(
+    response = sns_client().publish(
         TopicArn=TEXT_TOPIC_ARN,
         # PhoneNumber='string',
         Message=message,
@@ -71,8 +91,9 @@ def send_text(message):
         # MessageStructure='string',
     )
 
+@metrics.timed("sns.publish")
 def send_page(message):
-    response = SNS.publish(
+    response = sns_client().publish(
         TopicArn=PAGE_TOPIC_ARN,
         # PhoneNumber='string',
         Message=message,
@@ -80,8 +101,9 @@ def send_page(message):
         # MessageStructure='string',
     )
 
+@metrics.timed("sns.publish")
 def send_email(message, subject):
-    response = SNS.publish(
+    response = sns_client().publish(
         TopicArn=EMAIL_TOPIC_ARN,
         # PhoneNumber='string',
         Message=message,
@@ -89,95 +111,278 @@ def send_email(message, subject):
         # MessageStructure='string',
     )
 
-def notify(obj, should_publish=False):
+def build_messages(obj):
+    """
+    The message each channel gets for an event, as {channel: (body, subject)}.
+    """
+    messages = {}
     message = obj.text_notification()
     if message:
         l = len(message)
         print(f"Generated SMS message (l={l}):")
         print(message)
-        if should_publish:
-            print("Publishing SMS...")
-            # publish(message)
-            send_text(message)
-            print("Published SMS.")
+        messages["text"] = (message, None)
+        messages["page"] = (message, None)
     else:
         print("No SMS generated for event.")
     subject, body = obj.email_notification()
     if subject and body:
         print(f"Generated email message:\nSUBJECT: {subject}\nBODY:\n{body}")
-        if should_publish:
-            print("Publishing email...")
-            send_email(message=body, subject=subject)
-            print("Published email.")
+        messages["email"] = (body, subject)
     else:
         print("No email generated for event.")
+    return messages
 
-def scrape_events():
-    events = requests.get(ALERTS_URL).json()
-    # print(json.dumps(events, sort_keys=True))
+def notify(obj, should_publish=False, matches=None):
+    # With no explicit subscribers this goes to the stock text and email topics, same as before subscribers existed.
+    messages = build_messages(obj)
+    if should_publish:
+        matches = matches if matches is not None else subscribers.default_subscribers()
+        subscribers.publish(sns_client(), subscribers.deliveries(matches, messages))
+
+EVENTS_HWM_KEY = "events:high_water_mark"
+
+def load_events_high_water_mark():
+    state = orm.StateObject.get_state(EVENTS_HWM_KEY)
+    if "timestamp" not in state:
+        # First run with the high-water mark; start from whatever's newest in the table so we don't re-notify for old alerts.
+        latest = orm.EventObject.latest_n_events(1)
+        state["timestamp"] = latest[0]["timestamp"] if latest else 0
+        state["keys"] = [latest[0].key_string] if latest else []
+    return state
+
+def new_events(events, hwm):
+    """
+    The events that haven't been ingested yet, oldest first, and the issue times of any records that couldn't be parsed
+    (None for a record whose issue time couldn't be parsed either).
+    """
+    hwm_timestamp = hwm["timestamp"]
+    hwm_keys = set(hwm["keys"]) | set(hwm.get("above", {}))
+    found = {}
+    failed = []
     for event in events:
+        timestamp = None
         try:
-            obj = EventObject.parse_event(event)
-            print(f"Event found: {obj['space_weather_message_code']}/{obj['serial_number']} ({obj.pretty_timestamp})")
-            obj.save()
-            notify(obj, should_publish=obj.get("data",{}).get("latitude",90) < 51)
+            timestamp = orm.parse_event_timestamp(event["issue_datetime"])
+            if timestamp < hwm_timestamp:
+                continue
+            obj = orm.EventObject.parse_event(event)
+            if obj.key_string in hwm_keys:
+                continue
+            found[obj.key_string] = obj
         except:
-            message = traceback.format_exc()
-            if "ConditionalCheckFailedException" in message:
-                print("Reached the events that have already been saved.")
-                break
-            else:
-                print("Unexpected error!")
-                print(message)
+            print("Unable to parse event!")
+            traceback.print_exc()
+            failed.append(timestamp)
+    return sorted(found.values(), key=lambda o: o["timestamp"]), failed
 
-def scrape_short_forecast():
-    forecast = requests.get(SHORT_FORECAST_URL).text.replace("\r","")
-    ForecastObject.from_short_forecast(forecast, save=True)
+def advance_high_water_mark(hwm, objs, held=None):
+    """
+    Moves the high-water mark up to the newest event ingested so far, or only up to held (the issue time of a record that
+    failed to parse) so that record is tried again next run.  "keys" are the events ingested at the mark, and "above" maps
+    any ingested after it to their issue times, so none of them are ingested twice.
+    """
+    seen = {k: hwm["timestamp"] for k in hwm["keys"]}
+    seen.update(hwm.get("above", {}))
+    seen.update({o.key_string: o["timestamp"] for o in objs})
+    mark = held if held is not None else max(seen.values())
+    hwm["timestamp"] = mark
+    hwm["keys"] = [k for k, t in seen.items() if t == mark]
+    hwm["above"] = {k: t for k, t in seen.items() if t > mark}
+    hwm.save(force=True)
 
-def scrape_month_forecast():
-    forecast = requests.get(MONTH_FORECAST_URL).text.replace("\r","")
-    ForecastObject.from_month_forecast(forecast, save=True)
-
-def scrape_stuff(event, *args, **kwargs):
+def scrape_events():
+    feed = feeds.fetch(ALERTS_URL)
+    if not feed.changed:
+        print("Events feed unchanged, skipping.")
+        return False
+    hwm = load_events_high_water_mark()
+    objs, failed = new_events(feed.json(), hwm)
+    held = min((t for t in failed if t is not None), default=None)
+    if failed:
+        # Not committing the feed's validators means the next run fetches it in full and tries those records again.  Once
+        # they drop out of the feed, the mark moves on.
+        print(f"{len(failed)} records failed to parse; holding the feed for another try.")
+    if not objs:
+        print("No new events.")
+        if not failed:
+            feed.commit()
+        return False
+    for obj in objs:
+        print(f"Event found: {obj.key_string} ({obj.pretty_timestamp})")
+    # Earlier events in the same chains get their successors/status updated, and are written in the same batches.
+    relinked = chains.link(objs)
+    written = orm.EventObject.batch_save(objs + relinked)
+    print(f"Saved {len(objs)} new events and updated {len(relinked)} earlier ones in their chains ({written} writes).")
     try:
-        print("Scraping events...")
-        scrape_events()
+        search.index_events(objs)
     except:
+        print("Unable to update the search index!")
         traceback.print_exc()
+    orm.EVENT_CACHE.clear()
+    advance_high_water_mark(hwm, objs, held=held)
+    # Counted only once the high-water mark has moved past these events, so a retried run can't count them twice.
     try:
-        print("Scraping short-term forecast...")
-        scrape_short_forecast()
+        rollups.record_events(objs)
     except:
+        print("Unable to update event rollups!")
         traceback.print_exc()
     try:
-        print("Scraping long-term forecast...")
-        scrape_month_forecast()
+        snapshots.materialize(objs + relinked)
     except:
+        print("Unable to materialize page snapshots!")
         traceback.print_exc()
+    index = subscribers.get_index()
+    for obj in objs:
+        try:
+            notifications.QUEUE.enqueue(obj, index.match(obj), build_messages(obj))
+        except:
+            print("Unexpected error!")
+            traceback.print_exc()
+    scheduler.note_events(objs)
+    if not failed:
+        feed.commit()
+    return True
+
+def scrape_short_forecast():
+    feed = feeds.fetch(SHORT_FORECAST_URL)
+    if not feed.changed:
+        print("Short-term forecast unchanged, skipping.")
+        return False
+    forecast = feed.text.replace("\r","")
+    info = orm.ForecastObject.from_short_forecast(forecast, save=True)
+    if not info.in_db:
+        rows = timeseries.add_forecast(info, timeseries.SHORT)
+        accuracy.record_observations(rows)
+        scheduler.note_forecast(info)
+    feed.commit()
+    return not info.in_db
+
+def scrape_month_forecast():
+    feed = feeds.fetch(MONTH_FORECAST_URL)
+    if not feed.changed:
+        print("Long-term forecast unchanged, skipping.")
+        return False
+    forecast = feed.text.replace("\r","")
+    info = orm.ForecastObject.from_month_forecast(forecast, save=True)
+    if not info.in_db:
+        timeseries.add_forecast(info, timeseries.MONTH)
+    feed.commit()
+    return not info.in_db
+
+def send_notifications():
+    notifications.QUEUE.flush(sns_client())
+
+SCRAPE_STAGES = [
+    ("events", scrape_events),
+    ("short-term forecast", scrape_short_forecast),
+    ("long-term forecast", scrape_month_forecast),
+]
+
+# The stages are almost entirely network-bound, so running them side by side cuts most of the wall-clock time.
+# Set to 1 to go back to running them one after another.
+SCRAPE_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", len(SCRAPE_STAGES)))
+
+def _run_stage(name, func):
+    print(f"Scraping {name}...")
+    start = time.perf_counter()
+    ok = True
+    changed = None
+    try:
+        with metrics.span(f"stage.{name}"):
+            changed = func()
+    except:
+        ok = False
+        metrics.count("stage.failed")
+        traceback.print_exc()
+    duration = time.perf_counter() - start
+    return {"stage": name, "ok": ok, "changed": changed, "duration": duration}
+
+def scrape_stuff(event, *args, concurrency=None, **kwargs):
+    concurrency = int(concurrency) if concurrency else SCRAPE_CONCURRENCY
+    # Finish any lazy imports here rather than racing to do them from several worker threads at once.
+    orm.EventObject
+    timeseries.ForecastSeries
+    accuracy.score
+    subscribers.SubscriberIndex
+    notifications.QUEUE
+    chains.link
+    search.index_events
+    rollups.record_events
+    snapshots.materialize
+    scheduler.record
+    feeds.reset_stats()
+    start = time.perf_counter()
+    stages = SCRAPE_STAGES
+    if event.get("source") == "cron":
+        # A manual /scrape always fetches everything; cron runs leave out whatever the scheduler says isn't due yet.
+        due = scheduler.due_stages([name for name, _ in SCRAPE_STAGES])
+        stages = [(name, func) for name, func in SCRAPE_STAGES if name in due]
+        for name, _ in SCRAPE_STAGES:
+            if name not in due:
+                print(f"Skipping {name}, not due yet.")
+    if concurrency > 1 and len(stages) > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(_run_stage, name, func) for name, func in stages]
+            timings = [f.result() for f in futures]
+    else:
+        timings = [_run_stage(name, func) for name, func in stages]
+    try:
+        scheduler.record({t["stage"]: t["changed"] if t["ok"] else None for t in timings})
+    except:
+        print("Unable to update the polling schedule!")
+        traceback.print_exc()
+    # Whatever ingest queued up goes out once every stage is done.
+    timings.append(_run_stage("notifications", send_notifications))
+    total = time.perf_counter() - start
+    for t in timings:
+        print(f"Stage {t['stage']}: {t['duration']:.3f}s ({'ok' if t['ok'] else 'FAILED'})")
+    print(f"Scrape finished in {total:.3f}s (concurrency={concurrency}).")
+    print(feeds.stats_summary())
+    return timings
 
 @register_path("HTML", r"^/?scrape/?$")
 @returns_text
-def scrape_now(event, *args, **kwargs):
+def scrape_now(event, *args, concurrency=None, **kwargs):
     grabber = Grabber()
     with grabber:
-        scrape_stuff(event, *args, **kwargs)
+        scrape_stuff(event, *args, concurrency=concurrency, **kwargs)
     info = grabber.info()
     ind = ">>>>>>>>>>"
     output = f"{ind}STDOUT:\n{info['stdout']}\n{ind}STDERR:\n{info['stderr']}\n{ind}LOGS:\n{info['logs']}\n{ind}DURATION (s):\n{info['duration']}"
+    if info["truncated"]:
+        # The capture is capped, but everything was also passed through to the real stdout/stderr, i.e. the function's log.
+        message = f"{info['truncated']} bytes of scrape output were left out above (each stream is capped at {grabber.max_bytes} bytes by GRABBER_MAX_BYTES); the full output is in the function's log."
+        print(message)
+        output += f"\n{ind}TRUNCATED:\n{message}"
     return output
 
 @register_path("HTML", r"^/?events/list/?$")
 @returns_html("events/list.html")
 def events_list_page(event, *args, next_token=None, **kwargs):
-    response = EventObject.query_chronological(NextToken=next_token)
+    if not next_token:
+        snapshot = snapshots.serve(event, snapshots.list_name())
+        if snapshot:
+            return snapshot
+    response = orm.EventObject.cached_query_chronological(NextToken=next_token)
     events = response["Items"]
     token = response["NextToken"]
     return {"events":events, "next_token":token}
 
+@register_path("HTML", r"^/?events/search/?$")
+@returns_html("events/search.html")
+def events_search_page(event, *args, q=None, **kwargs):
+    events, total = search.search(q) if q else ([], 0)
+    return {"events":events, "total":total, "q":q or ""}
+
 @register_path("HTML", r"^/?events/(?P<space_weather_message_code>[A-Z0-9]{5,12})/?$")
 @returns_html("events/list_code.html")
 def events_list_code_page(event, space_weather_message_code, *args, next_token=None, **kwargs):
-    response = EventObject.query(space_weather_message_code=space_weather_message_code, NextToken=next_token, ScanIndexForward=False)
+    if not next_token:
+        snapshot = snapshots.serve(event, snapshots.list_code_name(space_weather_message_code))
+        if snapshot:
+            return snapshot
+    response = orm.EventObject.cached_query(space_weather_message_code=space_weather_message_code, NextToken=next_token, ScanIndexForward=False)
     events = response["Items"]
     token = response["NextToken"]
     return {"events":events, "next_token":token, "space_weather_message_code":space_weather_message_code}
@@ -186,11 +391,75 @@ def events_list_code_page(event, space_weather_message_code, *args, next_token=N
 @returns_html("events/view.html")
 def event_view_page(event, space_weather_message_code, serial_number, test_notification=None, *args, **kwargs):
     serial_number = int(serial_number)
-    event = EventObject.load(space_weather_message_code=space_weather_message_code, serial_number=serial_number)
+    if not test_notification:
+        snapshot = snapshots.serve(event, snapshots.view_name(space_weather_message_code, serial_number))
+        if snapshot:
+            return snapshot
+    event = orm.EventObject.cached_load(space_weather_message_code=space_weather_message_code, serial_number=serial_number)
     if test_notification:
         notify(event, should_publish=True)
+    chain = orm.EVENT_CACHE.get_or_load(orm.make_key("chain", key=event.key_string), lambda: chains.load_chain(event)) if event else []
     # can't have "event" as a key in the params handed back because it conflicts with the APIGateway event.
-    return {"_event":event, "space_weather_message_code":space_weather_message_code, "serial_number":serial_number}
+    return {"_event":event, "chain":chain, "space_weather_message_code":space_weather_message_code, "serial_number":serial_number}
+
+def _choice(name, value, choices):
+    if value not in choices:
+        HTTP400.throw(f"Unknown {name} '{value}'; expected one of: {', '.join(choices)}.")
+    return choices[value]
+
+def _day(name, value):
+    try:
+        return timeseries.day_number(value)
+    except ValueError:
+        HTTP400.throw(f"Bad {name} '{value}'; expected a date like 2023-04-24.")
+
+@register_path("API", r"^/?forecasts/daily_max/?$")
+@returns_json
+def forecast_daily_max(event, *args, kind="kp", product=None, start=None, end=None, **kwargs):
+    kind_code = _choice("kind", kind, timeseries.KINDS)
+    product = _choice("product", product, timeseries.PRODUCTS) if product else None
+    end = _day("end", end) if end else int(time.time()) // 86400
+    start = _day("start", start) if start else end - 365
+    days, values = timeseries.load_range(start, end).daily_max(kind_code, product=product, start=start, end=end)
+    return {"kind":kind, "days":[timeseries.day_string(d) for d in days], "values":values.tolist()}
+
+@register_path("API", r"^/?forecasts/drift/(?P<date>[0-9]{4}-[0-9]{2}-[0-9]{2})/?$")
+@returns_json
+def forecast_drift(event, date, *args, kind="kp", product="month", **kwargs):
+    kind_code = _choice("kind", kind, timeseries.KINDS)
+    product_code = _choice("product", product, timeseries.PRODUCTS)
+    day = _day("date", date)
+    issued, values = timeseries.load_range(day, day).drift(day, kind=kind_code, product=product_code)
+    return {"kind":kind, "date":date, "issued":[datetime.utcfromtimestamp(int(i)).isoformat() for i in issued], "values":values.tolist()}
+
+@register_path("API", r"^/?forecasts/accuracy/?$")
+@returns_json
+def forecast_accuracy(event, *args, **kwargs):
+    return accuracy.summary()
+
+@register_path("API", r"^/?stats/?$")
+@returns_json
+def stats_page(event, *args, rollup=None, prefix=None, **kwargs):
+    return rollups.summary(rollups=rollup.split(",") if rollup else None, prefix=prefix)
+
+def metrics_table(runs):
+    if not runs:
+        return "None yet."
+    lines = []
+    for run in runs:
+        started = datetime.utcfromtimestamp(run["started"]).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append(f"{run['kind']} at {started} UTC, {run['duration_ms']:.1f}ms")
+        for name, s in run["spans"].items():
+            lines.append(f"  {name:<32}{s['count']:>6} x {s['total_ms'] / s['count']:>9.2f}ms = {s['total_ms']:>9.1f}ms  (max {s['max_ms']:.1f}ms)")
+        for name, n in run["counters"].items():
+            lines.append(f"  {name:<32}{n:>6}")
+    return "\n".join(lines)
+
+def debug_page(event=None, context=None, headers={}, **kwargs):
+    body = ui_stuff.get_debug_blob(event)
+    body += "\n<pre>\nEvent cache:\n{}\n</pre>".format(json.dumps(orm.EVENT_CACHE.stats(), indent=2, sort_keys=True))
+    body += "\n<pre>\nLatest sampled runs (METRICS_SAMPLE_RATE={}):\n{}\n</pre>".format(metrics.SAMPLE_RATE, metrics_table(metrics.last_runs()))
+    return make_response(body=body, headers=headers)
 
 def get_cookies(event):
     cookie_dict = {}
@@ -204,24 +473,14 @@ def get_cookies(event):
         traceback.print_exc()
     return cookie_dict
 
-def _add_info_kwargs(info, kwargs):
-    if not kwargs:
-        return info
-    existing_kwargs = list(info.keys())
-    for k in kwargs:
-        if k not in existing_kwargs:
-            info[k] = kwargs[k]
-    return info
-
-def add_body_as_kwargs(info, *args, **kwargs):
-    if not info["event"].get("body"):
-        info["body"] = {}
-        return info
-    body = json.loads(info["event"]["body"])
-    info["body"] = body
-    return _add_info_kwargs(info, body)
-
-def add_qs_as_kwargs(info, *args, **kwargs):
-    qs_args = info["event"]["queryStringParameters"]
-    info["qs_args"] = qs_args
-    return _add_info_kwargs(info, qs_args)
+def json_body(event):
+    return json.loads(event["body"]) if event.get("body") else {}
+
+def query_string(event):
+    return event.get("queryStringParameters") or {}
+
+# Under the PrefixRouter these only parse when the matched handler takes a parameter they could fill.
+add_body_as_kwargs = LazyKwargs("body", json_body)
+add_qs_as_kwargs = LazyKwargs("qs_args", query_string)
+# For handlers that pass every query parameter along, e.g. to a template.
+add_all_qs_as_kwargs = LazyKwargs("qs_args", query_string, only_declared=False)
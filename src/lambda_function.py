@@ -1,47 +1,89 @@
 import traceback
 
 try:
-    import handlers
-
-    from sneks.sam.response_core import PathMatcher, ListMatcher, ResponseException, get_matchers
+    from sneks.sam.response_core import PathMatcher, ResponseException, get_matchers
     from sneks.sam import ui_stuff
 
+    from utils import EAGER_IMPORTS
+    import assets
+    import metrics
+    from router import PrefixRouter
+    import templates
+
+    # Use the templates the build precompiled into the bundle, when it did, and link them to the hashed assets.
+    templates.install()
+    templates.meter()
+    assets.install()
+
     STATIC_MATCHERS = [
+        PathMatcher(r"^/?(?P<filename>static/dist/.*)$", assets.get_asset),
         PathMatcher(r"^.*/favicon.ico$", ui_stuff.get_static, {"filename":"static/favicon_io_c/favicon.ico"}),
         PathMatcher(r"^/?(?P<filename>static/.*)$", ui_stuff.get_static),
     ]
 
-    STANDARD_PREPROCESSORS = [
-        handlers.add_qs_as_kwargs
-    ]
+    # Static files come first in the chain anyway, so they can be matched before handlers (and everything it imports) is loaded.
+    STATIC_CHAIN = PrefixRouter(STATIC_MATCHERS)
 
-    API_PREPROCESSORS = [
-        handlers.add_body_as_kwargs
-    ]
+    MATCHERS = None
 
-    HTML_MATCHERS = get_matchers("HTML", preprocessor_functions=STANDARD_PREPROCESSORS)
-    API_MATCHERS = get_matchers("API", preprocessor_functions=STANDARD_PREPROCESSORS + API_PREPROCESSORS)
+    def route_list():
+        import handlers
 
-    DEFAULT_MATCHERS = [
-        PathMatcher(r"^/?$", ui_stuff.get_page, {"template_name":"index.html"}, preprocessor_functions=STANDARD_PREPROCESSORS),
-        PathMatcher(r"^/?(?P<template_name>[a-z_]*.html)$", ui_stuff.get_page, preprocessor_functions=STANDARD_PREPROCESSORS),
-        PathMatcher(r".*debug.*", ui_stuff.make_debug, preprocessor_functions=STANDARD_PREPROCESSORS),
-        PathMatcher(r".*", ui_stuff.make_404)
-    ]
+        STANDARD_PREPROCESSORS = [
+            handlers.add_qs_as_kwargs
+        ]
+
+        API_PREPROCESSORS = [
+            handlers.add_body_as_kwargs
+        ]
+
+        # get_page hands the query parameters to the template, so it needs all of them.
+        PAGE_PREPROCESSORS = [
+            handlers.add_all_qs_as_kwargs
+        ]
+
+        HTML_MATCHERS = get_matchers("HTML", preprocessor_functions=STANDARD_PREPROCESSORS)
+        API_MATCHERS = get_matchers("API", preprocessor_functions=STANDARD_PREPROCESSORS + API_PREPROCESSORS)
+
+        DEFAULT_MATCHERS = [
+            PathMatcher(r"^/?$", ui_stuff.get_page, {"template_name":"index.html"}, preprocessor_functions=PAGE_PREPROCESSORS),
+            PathMatcher(r"^/?(?P<template_name>[a-z_]*.html)$", ui_stuff.get_page, preprocessor_functions=PAGE_PREPROCESSORS),
+            PathMatcher(r".*debug.*", handlers.debug_page, preprocessor_functions=STANDARD_PREPROCESSORS),
+            PathMatcher(r".*", ui_stuff.make_404)
+        ]
+
+        return STATIC_MATCHERS + HTML_MATCHERS + API_MATCHERS + DEFAULT_MATCHERS
+
+    def build_matchers():
+        return PrefixRouter(route_list())
+
+    def get_matchers_chain():
+        global MATCHERS
+        if MATCHERS is None:
+            MATCHERS = build_matchers()
+        return MATCHERS
 
-    MATCHERS = ListMatcher(STATIC_MATCHERS + HTML_MATCHERS + API_MATCHERS + DEFAULT_MATCHERS)
+    if EAGER_IMPORTS:
+        get_matchers_chain()
 
     def lambda_handler(event, context):
+        cron = "cron" == event.get("source")
+        metrics.start_run("cron" if cron else "http")
         try:
-            if "cron" == event.get("source"):
+            if cron:
                 print("Executing cron task...")
+                import handlers
                 return handlers.scrape_stuff(event, context)
             print("Sending to handler chain...")
-            response = MATCHERS.handle_event(event)
+            response = STATIC_CHAIN.handle_event(event)
+            if response is None:
+                response = get_matchers_chain().handle_event(event)
             print(response)
             return response
         except ResponseException as e:
             return e.response
+        finally:
+            metrics.finish_run()
 except:
     traceback.print_exc()
     raise
@@ -0,0 +1,169 @@
+"""
+Span timers and counters for the hot paths (feed fetches, parsing, DynamoDB calls, SNS publishes, template renders),
+emitted as one CloudWatch Embedded Metric Format line per invocation.
+
+lambda_handler starts a run for each invocation and finishes it on the way out.  Whether a run is recorded at all is
+decided once, up front, by METRICS_SAMPLE_RATE (0 to 1, default 0); in an unsampled run span() and count() return
+immediately, so leaving the calls in costs next to nothing.
+
+    with metrics.span("fetch"):
+        ...
+    metrics.count("fetch.not_modified")
+
+Each span name becomes <name>.ms (total time) and <name>.count metrics, and each counter its own metric, under the
+METRICS_NAMESPACE namespace (default "Carrington") with the run's kind ("cron" or "http") as the only dimension.  The
+line is printed, which is all Lambda needs to pick it up; set METRICS_FILE to also append it to a file locally.
+The last few finished runs are kept in memory for the debug page.
+"""
+
+from collections import deque
+from functools import update_wrapper
+import json
+import os
+import random
+import threading
+import time
+
+SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", 0) or 0)
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Carrington")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+KEEP_RUNS = 10
+
+class Run(object):
+    def __init__(self, kind, sampled):
+        self.kind = kind
+        self.sampled = sampled
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.lock = threading.Lock()
+        # name -> [count, total seconds, max seconds]
+        self.spans = {}
+        self.counters = {}
+
+    def add_span(self, name, seconds):
+        with self.lock:
+            s = self.spans.get(name)
+            if s is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                s[0] += 1
+                s[1] += seconds
+                if seconds > s[2]:
+                    s[2] = seconds
+
+    def add_count(self, name, n):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        return {
+            "kind": self.kind,
+            "started": self.started,
+            "duration_ms": (self.duration or 0) * 1000,
+            "spans": {name: {"count": c, "total_ms": total * 1000, "max_ms": longest * 1000} for name, (c, total, longest) in sorted(self.spans.items())},
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def emf(self):
+        values = {"duration.ms": (self.duration or 0) * 1000}
+        units = {"duration.ms": "Milliseconds"}
+        for name, (c, total, _) in self.spans.items():
+            values[f"{name}.ms"] = total * 1000
+            values[f"{name}.count"] = c
+            units[f"{name}.ms"] = "Milliseconds"
+            units[f"{name}.count"] = "Count"
+        for name, n in self.counters.items():
+            values[name] = n
+            units[name] = "Count"
+        blob = {
+            "_aws": {
+                "Timestamp": int(self.started * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Run"]],
+                    "Metrics": [{"Name": name, "Unit": units[name]} for name in sorted(values)],
+                }],
+            },
+            "Run": self.kind,
+        }
+        blob.update({name: round(v, 3) if isinstance(v, float) else v for name, v in values.items()})
+        return json.dumps(blob, separators=(",", ":"), sort_keys=True)
+
+# One invocation at a time per container, but a cron run fans out over threads, so this is deliberately not thread-local.
+CURRENT = None
+LAST_RUNS = deque(maxlen=KEEP_RUNS)
+
+def start_run(kind, sample_rate=None):
+    global CURRENT
+    rate = SAMPLE_RATE if sample_rate is None else sample_rate
+    CURRENT = Run(kind, sampled=rate > 0 and random.random() < rate)
+    return CURRENT
+
+def finish_run():
+    """
+    Ends the current run, emitting its metrics if it was sampled.  Returns the run's summary, or None.
+    """
+    global CURRENT
+    run, CURRENT = CURRENT, None
+    if run is None or not run.sampled:
+        return None
+    run.duration = time.perf_counter() - run.start
+    line = run.emf()
+    print(line)
+    if METRICS_FILE:
+        with open(METRICS_FILE, "a") as f:
+            f.write(line + "\n")
+    summary = run.summary()
+    LAST_RUNS.appendleft(summary)
+    return summary
+
+def last_runs():
+    return list(LAST_RUNS)
+
+class _NoSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NO_SPAN = _NoSpan()
+
+class _Span(object):
+    __slots__ = ("run", "name", "start")
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.run.add_span(self.name, time.perf_counter() - self.start)
+        return False
+
+def span(name):
+    run = CURRENT
+    if run is None or not run.sampled:
+        return NO_SPAN
+    return _Span(run, name)
+
+def count(name, n=1):
+    run = CURRENT
+    if run is not None and run.sampled:
+        run.add_count(name, n)
+
+def timed(name):
+    """
+    Decorator version of span().
+    """
+    def decorator(func):
+        def newfunc(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        update_wrapper(newfunc, func)
+        return newfunc
+    return decorator
@@ -0,0 +1,128 @@
+"""
+The notification stage of a scrape.
+
+scrape_events enqueues each new event's messages for the subscribers it matched, and scrape_stuff flushes the queue once
+ingest is done.  Flushing:
+  - claims each (event, channel, subscriber) with a conditional write to the StateTable, skipping anything a previous
+    (or overlapping) run already sent.  Claims expire after IDEMPOTENCY_TTL seconds.
+  - coalesces all of an email subscriber's alerts from the run into one digest message.  Texts and pages go out one per
+    alert, since each is already squeezed under the 160-character SMS limit and a digest of them wouldn't be.
+  - sends everything through subscribers.publish, the same path test notifications take, which groups the messages per
+    target into PublishBatch calls and retries failures with exponential backoff.  If a message still can't be sent, the
+    claims it covered are released so the next run tries again.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import traceback
+
+from botocore.exceptions import ClientError
+
+from orm import StateObject
+import subscribers
+
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", 0) or 8)
+IDEMPOTENCY_TTL = 30 * 24 * 3600
+EMAIL_SEPARATOR = "\n\n" + "-" * 40 + "\n\n"
+
+def claim_key(key_string, subscriber):
+    return f"sent:{key_string}/{subscriber['channel']}/{subscriber['subscriber_id']}"
+
+def claim(key):
+    record = StateObject(state_key=key, claimed_at=int(time.time()), expires_at=int(time.time()) + IDEMPOTENCY_TTL)
+    try:
+        record.create()
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+def release(key):
+    try:
+        StateObject(state_key=key).delete()
+    except:
+        traceback.print_exc()
+
+def digest(alerts):
+    """
+    Collapses [(body, subject)] for one email subscriber into a single (body, subject).
+    """
+    if len(alerts) == 1:
+        return alerts[0]
+    subject = f"{len(alerts)} space weather alerts"
+    body = EMAIL_SEPARATOR.join(f"{s}\n\n{b}" if s else b for b, s in alerts)
+    return body, subject
+
+def outgoing(channel, claimed):
+    """
+    Groups [(claim key, (body, subject))] into the messages to publish: [([claim keys], (body, subject))].
+    """
+    if channel == "email":
+        return [([key for key, _ in claimed], digest([message for _, message in claimed]))]
+    return [([key], message) for key, message in claimed]
+
+class NotificationQueue(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = OrderedDict()
+
+    def __len__(self):
+        return sum(len(alerts) for _, alerts in self.pending.values())
+
+    def enqueue(self, obj, matches, messages):
+        with self.lock:
+            for subscriber, message in subscribers.deliveries(matches, messages):
+                entry = self.pending.setdefault(subscriber["subscriber_id"], (subscriber, []))
+                entry[1].append((obj.key_string, message))
+
+    def _claim(self, subscriber, alerts):
+        """
+        Claims a subscriber's alerts and groups the ones not sent already into [(subscriber, [claim keys], (body, subject))].
+        """
+        claimed = []
+        for key_string, message in alerts:
+            key = claim_key(key_string, subscriber)
+            if claim(key):
+                claimed.append((key, message))
+            else:
+                print(f"Already sent {key}, skipping.")
+        return [(subscriber, keys, message) for keys, message in outgoing(subscriber["channel"], claimed)]
+
+    def flush(self, client, concurrency=None):
+        """
+        Sends everything queued so far and empties the queue.  Returns the number of alerts delivered.
+        """
+        concurrency = concurrency if concurrency else NOTIFY_CONCURRENCY
+        with self.lock:
+            batch = list(self.pending.values())
+            self.pending.clear()
+        if not batch:
+            return 0
+
+        def claim_all(entry):
+            try:
+                return self._claim(*entry)
+            except:
+                print(f"Unable to notify {entry[0]['subscriber_id']}!")
+                traceback.print_exc()
+                return []
+
+        # Claims are one conditional write each, so they go out on a pool too.
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batch))) as pool:
+            messages = [m for claimed in pool.map(claim_all, batch) for m in claimed]
+        delivered = subscribers.publish(client, [(subscriber, message) for subscriber, _, message in messages], concurrency=concurrency)
+        sent = 0
+        for (_, keys, _), ok in zip(messages, delivered):
+            if ok:
+                sent += len(keys)
+            else:
+                for key in keys:
+                    release(key)
+        print(f"Delivered {sent} alerts to {len(batch)} subscribers.")
+        return sent
+
+QUEUE = NotificationQueue()
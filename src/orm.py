@@ -1,14 +1,26 @@
-from datetime import datetime, timedelta
+import copy
+from datetime import datetime, timedelta, timezone
+import heapq
 import os
+import re
+import time
 import traceback
-from boto3.dynamodb.conditions import Key as DDBKey
+import zlib
+from boto3.dynamodb.conditions import Attr, Key as DDBKey
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
 
 from sneks.ddb import make_json_safe
+from cache import TTLCache, make_key
+import metrics
 import sneks.snekjson as json
-from sneks.ddb.orm import CFObject, ensure_ddbsafe
+from sneks.ddb.orm import CFObject, SamTable, ensure_ddbsafe, record_write_capacity, _fix_types, DECIMAL, VERSION_KEY
 
 _EventObject = CFObject.lazysubclass(stack_name=os.environ["STACK_NAME"], logical_name="EventTable")
 _ForecastObject = CFObject.lazysubclass(stack_name=os.environ["STACK_NAME"], logical_name="ForecastTable")
+_StateObject = CFObject.lazysubclass(stack_name=os.environ["STACK_NAME"], logical_name="StateTable")
+_SubscriberObject = CFObject.lazysubclass(stack_name=os.environ["STACK_NAME"], logical_name="SubscriberTable")
+_RollupObject = CFObject.lazysubclass(stack_name=os.environ["STACK_NAME"], logical_name="RollupTable")
 
 def clean_key(k):
     k = k.lower()
@@ -51,6 +63,57 @@ KP_KEY = "kp_forecasts"
 STORM_KEY = "storm_forecasts"
 
 SOURCE_EVENTS= "EVENTS"
+CHRONOLOGICAL_INDEX = "source-timestamp-index"
+
+# With more than one shard, events are spread over EVENTS#0..EVENTS#n-1 in the source-timestamp-index GSI instead of all landing
+# on the single EVENTS partition, and chronological reads merge the shards back together.  The highest shard count any writer
+# has used is kept in the StateTable, and reads cover that many shards, so changing the setting (up or down) never strands
+# events written under the old count.
+EVENT_SOURCE_SHARDS = int(os.environ.get("EVENT_SOURCE_SHARDS", 1))
+SOURCE_SHARDS_STATE_KEY = "events:source_shards"
+CHRONOLOGICAL_PAGE_SIZE = 50
+
+def shard_source(shard):
+    return f"{SOURCE_EVENTS}#{shard}"
+
+def event_source(space_weather_message_code, serial_number):
+    if EVENT_SOURCE_SHARDS <= 1:
+        return SOURCE_EVENTS
+    shard = zlib.crc32(f"{space_weather_message_code}/{serial_number}".encode("utf-8")) % EVENT_SOURCE_SHARDS
+    return shard_source(shard)
+
+_SHARDS_NOTED = False
+
+def note_source_shards():
+    """
+    Records EVENT_SOURCE_SHARDS as the highest shard count used, if it is.  Called before events are written; only the first
+    call in a container does anything.
+    """
+    global _SHARDS_NOTED
+    if _SHARDS_NOTED or EVENT_SOURCE_SHARDS <= 1:
+        return
+    try:
+        StateObject.TABLE().update_item(
+            Key={"state_key": SOURCE_SHARDS_STATE_KEY},
+            UpdateExpression="SET highest = :n",
+            ConditionExpression=Attr("highest").not_exists() | Attr("highest").lt(EVENT_SOURCE_SHARDS),
+            ExpressionAttributeValues={":n": EVENT_SOURCE_SHARDS},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+    _SHARDS_NOTED = True
+
+def source_shard_count():
+    recorded = EVENT_CACHE.get_or_load(make_key("source_shards"), lambda: int(StateObject.get_state(SOURCE_SHARDS_STATE_KEY).get("highest", 1)))
+    return max(EVENT_SOURCE_SHARDS, recorded)
+
+def event_sources():
+    shards = source_shard_count()
+    if shards <= 1:
+        return [SOURCE_EVENTS]
+    # The unsharded partition stays in the rotation so events written before sharding was turned on are still listed.
+    return [SOURCE_EVENTS] + [shard_source(i) for i in range(shards)]
 
 IGNORE = [
     "NOAA Space Weather Scale descriptions can be found at",
@@ -102,6 +165,38 @@ EASY_TO_PARSE = [
         "Yesterday Maximum 2MeV Flux: ",
     ]
 
+POTENTIAL_IMPACTS = "Potential Impacts: "
+POLEWARD_IMPACT = "Potential Impacts: Area of impact primarily poleward of "
+IMPACT_PREFIXES = ["Radio - ","Induced Currents - ","Aurora - ","Spacecraft - ","Navigation - "]
+
+def compile_prefixes(prefixes):
+    # Longest first, so a prefix can never shadow a longer prefix that starts with it.
+    alternation = "|".join(re.escape(p) for p in sorted(prefixes, key=len, reverse=True))
+    return re.compile(f"(?:{alternation})")
+
+def _store_value(data, key, line, value):
+    data[key] = value.strip()
+
+def _store_potential_impacts(data, key, line, value):
+    if not line.startswith("Potential Impacts: Satellite") and not line.startswith("Potential Impacts: Area"):
+        sline = value.strip()
+        match = IMPACT_MATCHER.match(sline)
+        if match:
+            data[IMPACT_KEYS[match.group(0)]] = sline[match.end():].strip()
+    if line.startswith(POLEWARD_IMPACT):
+        # record this separately but still also parse this line as a normal prefix
+        data["latitude"] = int(line[len(POLEWARD_IMPACT):].strip().split(" ")[0])
+    data[key] = value.strip()
+
+# Everything below is built once at import so parse_event can classify each line with a single regex match and dict lookup.
+_IGNORE = frozenset(IGNORE)
+PREFIX_MATCHER = compile_prefixes(EASY_TO_PARSE)
+PREFIX_DISPATCH = {prefix:(clean_key(prefix), _store_value) for prefix in EASY_TO_PARSE}
+PREFIX_DISPATCH[POTENTIAL_IMPACTS] = (clean_key(POTENTIAL_IMPACTS), _store_potential_impacts)
+IMPACT_MATCHER = compile_prefixes(IMPACT_PREFIXES)
+IMPACT_KEYS = {prefix:clean_key(prefix) for prefix in IMPACT_PREFIXES}
+
+@metrics.timed("parse.event")
 def parse_event(msg):
     lines = msg.split("\r\n")
     lines = [l.strip() for l in lines if l.strip()]
@@ -109,12 +204,11 @@ def parse_event(msg):
     last_line_handled = -1
     unhandled_lines = []
     for i in range(len(lines)):
-        handled = False
         if i <= last_line_handled:
             # this is just used in a couple cases where the contents of one line tell us how to parse the following line
             continue
         line = lines[i]
-        if line in IGNORE:
+        if line in _IGNORE:
             continue
         if line == "THIS SUPERSEDES ANY/ALL PRIOR WATCHES IN EFFECT":
             data["supersedes"] = line
@@ -126,23 +220,13 @@ def parse_event(msg):
             data[clean_key(line)] = days
             last_line_handled = i+1
             continue
-        if line.startswith("Potential Impacts: ") and not line.startswith("Potential Impacts: Satellite") and not line.startswith("Potential Impacts: Area"):
-            sline = line[len("Potential Impacts: "):].strip()
-            for prefix in ["Radio - ","Induced Currents - ","Aurora - ","Spacecraft - ","Navigation - "]:
-                if sline.startswith(prefix):
-                    data[clean_key(prefix)] = sline[len(prefix):].strip()
-                    handled = True
-        poleward_impact = "Potential Impacts: Area of impact primarily poleward of "
-        if line.startswith(poleward_impact):
-            # record this separately but still also parse this line with the later parser
-            data["latitude"] = int(line[len(poleward_impact):].strip().split(" ")[0])
-        for prefix in EASY_TO_PARSE:
-            if line.startswith(prefix):
-                data[clean_key(prefix)] = line[len(prefix):].strip()
-                handled = True
-        if not handled:
+        match = PREFIX_MATCHER.match(line)
+        if not match:
             print(f"UNHANDLED LINE: {line}")
             unhandled_lines.append(line)
+            continue
+        key, handler = PREFIX_DISPATCH[match.group(0)]
+        handler(data, key, line, line[match.end():])
     for x in ["valid_from", "valid_to", "issue_time", "now_valid_until","threshold_reached"]:
         if x in data:
             ts = data[x]
@@ -152,11 +236,207 @@ def parse_event(msg):
         data["unhandled_lines"] = unhandled_lines
     return data
 
+def parse_event_expiry(data):
+    # Extended warnings replace their valid_to with now_valid_until.
+    for k in ["now_valid_until", "valid_to"]:
+        if k in data:
+            return datetime.strptime(data[k], "%Y/%m/%dT%H:%MZ").replace(tzinfo=timezone.utc).timestamp()
+    return None
+
 def parse_event_timestamp(tss):
     # "issue_datetime": "2023-04-24 17:55:48.160"
     return datetime.strptime(tss, "%Y-%m-%d %H:%M:%S.%f").timestamp()
 
-class EventObject(_EventObject):
+# DynamoDB's hard limits for a single BatchWriteItem/BatchGetItem call.
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+
+def chunks(l, n):
+    for i in range(0, len(l), n):
+        yield l[i:i+n]
+
+class MeteredTable(SamTable):
+    # Every single-item read/write, query and scan goes through here, so this is where they're timed.
+    def _do_stuff(self, *args, _innerfuncname=None, **kwargs):
+        with metrics.span(f"ddb.{_innerfuncname}"):
+            return super()._do_stuff(*args, _innerfuncname=_innerfuncname, **kwargs)
+
+class MeteredMixin(object):
+    @classmethod
+    def TABLE(cls):
+        table = super().TABLE()
+        if not isinstance(table, MeteredTable):
+            table = cls._TABLE_CACHE = MeteredTable(table.table)
+        return table
+
+class BatchMixin(object):
+    def _item_to_save(self):
+        # Same preparation that DynamoObject._store does before a put_item.
+        item = copy.deepcopy(self)
+        missing = [r for r in self._get_required_attributes() if not item.get(r, None)]
+        if missing:
+            raise RuntimeError('The following attributes are missing and must be added before saving: '+', '.join(missing))
+        return ensure_ddbsafe(item)
+
+    @classmethod
+    def batch_save(cls, objects, max_attempts=6):
+        """
+        Unconditionally writes the objects with BatchWriteItem, 25 at a time, retrying anything DynamoDB hands back as unprocessed.
+        Unlike save() there's no version check, so only use this for objects the caller knows are new (or is happy to overwrite).
+        """
+        deduped = {}
+        for obj in objects:
+            obj[VERSION_KEY] = DECIMAL(obj.get(VERSION_KEY, -1)) + 1
+            key = tuple(sorted(obj._get_key_dict().items()))
+            deduped[key] = obj
+        table = cls.TABLE().table
+        client = table.meta.client
+        written = 0
+        for chunk in chunks(list(deduped.values()), BATCH_WRITE_SIZE):
+            put_requests = [{"PutRequest": {"Item": obj._item_to_save()}} for obj in chunk]
+            attempt = 0
+            while put_requests:
+                if attempt >= max_attempts:
+                    raise RuntimeError(f"Unable to write {len(put_requests)} items to {table.name} after {max_attempts} attempts.")
+                if attempt:
+                    time.sleep(0.05 * 2**attempt)
+                with metrics.span("ddb.batch_write_item"):
+                    response = client.batch_write_item(RequestItems={table.name: put_requests}, ReturnConsumedCapacity="TOTAL")
+                record_write_capacity(sum(c.get("CapacityUnits", 0) for c in response.get("ConsumedCapacity", [])))
+                unprocessed = response.get("UnprocessedItems", {}).get(table.name, [])
+                written += len(put_requests) - len(unprocessed)
+                put_requests = unprocessed
+                attempt += 1
+        return written
+
+    @classmethod
+    def batch_load(cls, keys, max_attempts=6):
+        """
+        Loads the items for a list of key dicts with BatchGetItem, 100 at a time.  Missing items are skipped, and the results
+        come back in no particular order.
+        """
+        deduped = {tuple(sorted(k.items())): k for k in keys}
+        table = cls.TABLE().table
+        client = table.meta.client
+        objects = []
+        for chunk in chunks(list(deduped.values()), BATCH_GET_SIZE):
+            request = {table.name: {"Keys": chunk}}
+            attempt = 0
+            while request:
+                if attempt >= max_attempts:
+                    raise RuntimeError(f"Unable to read {len(request[table.name]['Keys'])} items from {table.name} after {max_attempts} attempts.")
+                if attempt:
+                    time.sleep(0.05 * 2**attempt)
+                with metrics.span("ddb.batch_get_item"):
+                    response = client.batch_get_item(RequestItems=request)
+                objects += [cls(dict(_fix_types(item))) for item in response.get("Responses", {}).get(table.name, [])]
+                request = response.get("UnprocessedKeys") or {}
+                attempt += 1
+        return objects
+
+# Opt-in compact item encoding.  With COMPACT_STORAGE set, saves store large text attributes zlib-compressed as <name>_z binaries
+# and the parsed event data under short keys.  Items in either format load the same way, decoded on first access, so the
+# setting can be flipped (and compact.py run to migrate) at any time.
+COMPACT_STORAGE = os.environ.get("COMPACT_STORAGE", "").lower() in ["1", "true", "yes"]
+COMPRESSED_SUFFIX = "_z"
+
+# Position in this list is the short key, so only ever append to it.
+EVENT_DATA_KEYS = [
+    "alert", "active_warning", "aurora", "begin_time", "cancel_warning", "continued_alert", "cancel_serial_number", "comment",
+    "continuation_of_serial_number", "description", "deviation", "extended_warning", "end_time", "estimated_velocity",
+    "extension_to_serial_number", "ip_shock_passage_observed", "induced_currents", "issue_time", "location", "maximum_10mev_flux",
+    "maximum_time", "noaa_scale", "navigation", "now_valid_until", "observed", "optical_class", "original_issue_time",
+    "potential_impacts", "radio", "summary", "serial_number", "space_weather_message_code", "spacecraft", "station",
+    "synoptic_period", "threshold_reached", "valid_from", "valid_to", "warning", "watch", "warning_condition", "xray_class",
+    "yesterday_maximum_2mev_flux", "latitude", "supersedes", "highest_storm_level_predicted_by_day", "unhandled_lines",
+]
+
+class Abbreviations(object):
+    def __init__(self, keys):
+        self.short = {k: format(i, "x") for i, k in enumerate(keys)}
+        self.long = {v: k for k, v in self.short.items()}
+
+class CompactMixin(object):
+    # attribute names stored compressed
+    _COMPRESSED = []
+    # attribute name -> (stored name, Abbreviations) for dicts stored with short keys
+    _ABBREVIATED = {}
+
+    def _decode(self, key):
+        compressed = dict.get(self, key + COMPRESSED_SUFFIX) if key in self._COMPRESSED else None
+        if compressed is not None:
+            dict.__setitem__(self, key, zlib.decompress(bytes(compressed.value)).decode("utf-8"))
+            dict.pop(self, key + COMPRESSED_SUFFIX, None)
+            return
+        if key in self._ABBREVIATED:
+            short_name, keys = self._ABBREVIATED[key]
+            short = dict.get(self, short_name)
+            if short is not None:
+                dict.__setitem__(self, key, {keys.long.get(k, k): v for k, v in short.items()})
+                dict.pop(self, short_name, None)
+
+    def _encoded(self, key):
+        if key in self._COMPRESSED and dict.__contains__(self, key + COMPRESSED_SUFFIX):
+            return True
+        return key in self._ABBREVIATED and dict.__contains__(self, self._ABBREVIATED[key][0])
+
+    def __getitem__(self, key):
+        if not dict.__contains__(self, key) and self._encoded(key):
+            self._decode(key)
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if not dict.__contains__(self, key) and self._encoded(key):
+            self._decode(key)
+        return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or self._encoded(key)
+
+    def decode_all(self):
+        for key in list(self._COMPRESSED) + list(self._ABBREVIATED):
+            if not dict.__contains__(self, key) and self._encoded(key):
+                self._decode(key)
+        return self
+
+    def _compact(self, item):
+        for key in self._COMPRESSED:
+            if isinstance(item.get(key), str):
+                item[key + COMPRESSED_SUFFIX] = Binary(zlib.compress(item.pop(key).encode("utf-8"), 9))
+        for key, (short_name, keys) in self._ABBREVIATED.items():
+            if isinstance(item.get(key), dict):
+                item[short_name] = {keys.short.get(k, k): v for k, v in item.pop(key).items()}
+        return item
+
+    def _item_to_save(self):
+        # Binary attributes don't survive ensure_ddbsafe, so anything still encoded is decoded before the usual preparation.
+        self.decode_all()
+        item = super()._item_to_save()
+        return self._compact(item) if COMPACT_STORAGE else item
+
+    def _store(self, CE=None):
+        item = self._item_to_save()
+        if CE:
+            self.__class__.TABLE().put_item(Item=item, ConditionExpression=CE)
+        else:
+            self.__class__.TABLE().put_item(Item=item)
+        return self
+
+# Where an event stands in its chain of continuations/extensions/cancellations; see chains.py.
+CHAIN_ACTIVE = "active"
+CHAIN_SUPERSEDED = "superseded"
+CHAIN_CANCELLED = "cancelled"
+CHAIN_CANCELLATION = "cancellation"
+# Never stored; see EventObject.status.
+CHAIN_EXPIRED = "expired"
+
+# Events only change when the cron scrape runs (every 5 minutes), so page reads can be served from memory in between.
+EVENT_CACHE = TTLCache(maxsize=int(os.environ.get("EVENT_CACHE_SIZE", 256)), ttl=int(os.environ.get("EVENT_CACHE_TTL", 300)))
+
+class EventObject(MeteredMixin, CompactMixin, BatchMixin, _EventObject):
+    _COMPRESSED = ["message"]
+    _ABBREVIATED = {"data": ("d", Abbreviations(EVENT_DATA_KEYS))}
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self['serial_number'] = int(self['serial_number'])
@@ -165,11 +445,11 @@ class EventObject(_EventObject):
     def parse_event(cls, contents, save=False):
         product_id = contents.get("product_id", "X00X")
         timestamp = parse_event_timestamp(contents["issue_datetime"])
-        source = SOURCE_EVENTS
         message = contents.get("message","?")
         data = parse_event(message)
         space_weather_message_code = data["space_weather_message_code"]
         serial_number = int(data["serial_number"])
+        source = event_source(space_weather_message_code, serial_number)
         event = cls(
             space_weather_message_code=space_weather_message_code,
             serial_number=serial_number,
@@ -179,16 +459,48 @@ class EventObject(_EventObject):
             message=message,
             data=data
         )
+        expires_at = parse_event_expiry(data)
+        if expires_at:
+            event["expires_at"] = expires_at
         if save:
             event.save()
         return event
 
+    @property
+    def key_string(self):
+        return f"{self['space_weather_message_code']}/{self['serial_number']}"
+
+    @staticmethod
+    def key_from_string(key_string):
+        space_weather_message_code, serial_number = key_string.split("/")
+        return {"space_weather_message_code": space_weather_message_code, "serial_number": int(serial_number)}
+
+    def is_active(self, now=None):
+        # Events stored before chains were tracked have no chain_status, and are treated as active until they expire.
+        if self.get("chain_status", CHAIN_ACTIVE) != CHAIN_ACTIVE:
+            return False
+        expires_at = self.get("expires_at")
+        return expires_at is None or expires_at > (now if now is not None else time.time())
+
+    def status(self, now=None):
+        # What the pages show: the stored chain_status, except that an active alert past its validity window has expired.
+        chain_status = self.get("chain_status", CHAIN_ACTIVE)
+        if chain_status == CHAIN_ACTIVE and not self.is_active(now):
+            return CHAIN_EXPIRED
+        return chain_status
+
     @property
     def pretty_timestamp(self):
         dt = datetime.fromtimestamp(self["timestamp"])
         dt_string = dt.strftime("%Y/%m/%d %H:%M:%S")
         return dt_string
 
+    @property
+    def pretty_expiry(self):
+        if self.get("expires_at") is None:
+            return ""
+        return datetime.fromtimestamp(self["expires_at"], tz=timezone.utc).strftime("%Y/%m/%d %H:%M:%S")
+
     @property
     def summary(self):
         data = self["data"]
@@ -204,12 +516,77 @@ class EventObject(_EventObject):
 
     @classmethod
     def latest_n_events(cls, n):
-        response = cls.query(IndexName="source-timestamp-index", source=SOURCE_EVENTS, ScanIndexForward=False, MaxResults=n)
+        response = cls.query_chronological(MaxResults=n)
         return response.get("Items",[])
 
+    @classmethod
+    def batch_save(cls, objects, **kwargs):
+        note_source_shards()
+        return super().batch_save(objects, **kwargs)
+
+    def save(self, *args, **kwargs):
+        note_source_shards()
+        return super().save(*args, **kwargs)
+
     @classmethod
     def query_chronological(cls, **kwargs):
-        return cls.query(IndexName="source-timestamp-index", source=SOURCE_EVENTS, ScanIndexForward=False, **kwargs)
+        if event_sources() == [SOURCE_EVENTS]:
+            return cls.query(IndexName=CHRONOLOGICAL_INDEX, source=SOURCE_EVENTS, ScanIndexForward=False, **kwargs)
+        return cls._query_shards_chronological(**kwargs)
+
+    @classmethod
+    def _query_shards_chronological(cls, NextToken=None, Limit=None, MaxResults=None, **kwargs):
+        """
+        Scatter-gather over every source shard, merging the newest-first streams into one page.
+        NextToken maps each shard that still has items to the key of the last item taken from it (None if none taken yet),
+        so nothing is skipped or repeated between pages no matter how the shards interleave.
+        """
+        limit = Limit if Limit else (MaxResults if MaxResults else CHRONOLOGICAL_PAGE_SIZE)
+        cursors = cls._decode_nexttoken(NextToken) if NextToken else {source: None for source in event_sources()}
+        responses = {}
+        for source, start_key in cursors.items():
+            params = dict(kwargs, IndexName=CHRONOLOGICAL_INDEX, source=source, ScanIndexForward=False, Limit=limit)
+            if start_key:
+                params["ExclusiveStartKey"] = start_key
+            responses[source] = cls.query(**params)
+        streams = [[(item["timestamp"], source, item) for item in response["Items"]] for source, response in responses.items()]
+        merged = heapq.merge(*streams, key=lambda x: x[0], reverse=True)
+        items = []
+        taken = {source: [] for source in responses}
+        for _, source, item in merged:
+            if len(items) >= limit:
+                break
+            items.append(item)
+            taken[source].append(item)
+        next_cursors = {}
+        for source, response in responses.items():
+            more_in_page = len(taken[source]) < len(response["Items"])
+            if not more_in_page and not response["NextToken"]:
+                continue
+            if taken[source]:
+                last = taken[source][-1]
+                next_cursors[source] = {k: last[k] for k in ["space_weather_message_code", "serial_number", "source", "timestamp"]}
+            else:
+                next_cursors[source] = cursors[source]
+        return {
+            "Items": items,
+            "Count": len(items),
+            "ScannedCount": sum(r["ScannedCount"] for r in responses.values()),
+            "NextToken": cls._encode_nexttoken(next_cursors) if next_cursors else None,
+            "RawResponse": None,
+        }
+
+    @classmethod
+    def cached_query_chronological(cls, **kwargs):
+        return EVENT_CACHE.get_or_load(make_key("query_chronological", **kwargs), lambda: cls.query_chronological(**kwargs))
+
+    @classmethod
+    def cached_query(cls, **kwargs):
+        return EVENT_CACHE.get_or_load(make_key("query", **kwargs), lambda: cls.query(**kwargs))
+
+    @classmethod
+    def cached_load(cls, **kwargs):
+        return EVENT_CACHE.get_or_load(make_key("load", **kwargs), lambda: cls.load(**kwargs))
 
     def url(self):
         return f"https://apps.didelphisresearch.org/carrington/events/{self['data']['space_weather_message_code']}/{self['data']['serial_number']}"
@@ -235,7 +612,7 @@ class EventObject(_EventObject):
     def email_notification(self):
         data = self["data"]
         if "aurora" not in data or "latitude" not in data:
-            return None
+            return None, None
         subject = self.summary
         # url = f"https://apps.didelphisresearch.org/carrington/events/{data['space_weather_message_code']}/{data['serial_number']}"
         message = f"{self['message']}\n\n{self.url()}"
@@ -271,7 +648,9 @@ class EventObject(_EventObject):
     # def all_since(cls, source, timestamp):
     #     return cls.load_range(source, start=timestamp, oldest=False)
 
-class ForecastObject(_ForecastObject):
+class ForecastObject(MeteredMixin, CompactMixin, BatchMixin, _ForecastObject):
+    _COMPRESSED = ["raw"]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -283,12 +662,15 @@ class ForecastObject(_ForecastObject):
         obj = cls.load(product=product, timestamp=timestamp)
         if obj:
             print(f"Forecast {product}@{issued} already added to database.")
+            obj.in_db = True
             return obj, True
         info = cls(product=product, timestamp=timestamp, issued=issued)
         info["raw"] = forecast
+        info.in_db = False
         return info, False
 
     @classmethod
+    @metrics.timed("parse.forecast")
     def from_month_forecast(cls, forecast, save=False):
         info, in_db = cls._shared_setup(forecast)
         if in_db:
@@ -314,6 +696,7 @@ class ForecastObject(_ForecastObject):
         return info
 
     @classmethod
+    @metrics.timed("parse.forecast")
     def from_short_forecast(cls, forecast, save=False):
         info, in_db = cls._shared_setup(forecast)
         if in_db:
@@ -369,3 +752,33 @@ class ForecastObject(_ForecastObject):
         if save:
             info.save()
         return info
+
+class StateObject(MeteredMixin, _StateObject):
+    """
+    Small named blobs of bookkeeping state (feed validators, high-water marks, etc.) that need to survive across Lambda containers.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def get_state(cls, state_key):
+        obj = cls.load(state_key=state_key)
+        if obj:
+            return obj
+        return cls(state_key=state_key)
+
+class SubscriberObject(MeteredMixin, _SubscriberObject):
+    """
+    One notification recipient: a channel (text/email/page), a target (SNS topic ARN, or a phone number for texts),
+    the geomagnetic latitude below which an event's impact area should reach them, and optional message-code prefixes.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+class RollupObject(MeteredMixin, _RollupObject):
+    """
+    One precomputed event count: rollup names the dimension(s) being counted and bucket the value(s), e.g. ("code", "WATA20")
+    or ("kind#scale#month", "watch#G3#2023-04").  Maintained by rollups.py.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Precomputed event counts, so statistics never need to scan the EventTable.
+
+Each new event bumps one counter per rollup below with an atomic ADD, and /stats reads the counters back with a query per
+rollup.  The rebuild command recounts everything from scratch for data that was ingested before rollups existed:
+
+    python3 src/rollups.py rebuild
+"""
+
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+import re
+import sys
+
+from orm import RollupObject
+
+# rollup name -> the bucket fields joined with "#"
+ROLLUPS = {
+    "code": ["code"],
+    "month": ["month"],
+    "scale": ["scale"],
+    "code#month": ["code", "month"],
+    "kind#scale#month": ["kind", "scale", "month"],
+}
+SUMMARY_ROLLUPS = ["code", "month", "scale"]
+KINDS = ["alert", "watch", "warning", "summary", "extended_warning", "cancel_warning", "continued_alert"]
+SCALE = re.compile(r"\b([GRS])([1-5])\b")
+
+def event_scale(data):
+    """
+    The highest NOAA scale level (G1-G5, R1-R5, S1-S5) an event mentions, or "none".
+    """
+    text = data.get("noaa_scale", "")
+    predicted = data.get("highest_storm_level_predicted_by_day")
+    if isinstance(predicted, dict):
+        text += " " + " ".join(predicted.values())
+    levels = SCALE.findall(text)
+    if not levels:
+        return "none"
+    letter, level = max(levels, key=lambda l: int(l[1]))
+    return f"{letter}{level}"
+
+def event_kind(data):
+    for k in KINDS:
+        if k in data:
+            return k
+    return "other"
+
+def event_fields(obj):
+    data = obj.get("data", {})
+    return {
+        "code": obj["space_weather_message_code"],
+        "month": datetime.fromtimestamp(obj["timestamp"], tz=timezone.utc).strftime("%Y-%m"),
+        "scale": event_scale(data),
+        "kind": event_kind(data),
+    }
+
+def count_events(objs):
+    counts = Counter()
+    for obj in objs:
+        fields = event_fields(obj)
+        for rollup, parts in ROLLUPS.items():
+            counts[(rollup, "#".join(fields[p] for p in parts))] += 1
+    return counts
+
+def record_events(objs):
+    """
+    Adds newly ingested events to the counters.  One UpdateItem per distinct (rollup, bucket), however many events there are.
+    """
+    counts = count_events(objs)
+    table = RollupObject.TABLE()
+    for (rollup, bucket), n in counts.items():
+        table.update_item(
+            Key={"rollup": rollup, "bucket": bucket},
+            UpdateExpression="ADD #count :n",
+            ExpressionAttributeNames={"#count": "count"},
+            ExpressionAttributeValues={":n": n},
+        )
+    return len(counts)
+
+def read_rollup(rollup, prefix=None):
+    """
+    {bucket: count} for one rollup, optionally only the buckets starting with prefix (e.g. "watch#G3" for kind#scale#month).
+    """
+    kwargs = {"rollup": rollup}
+    if prefix:
+        kwargs["bucket"] = ("begins_with", prefix)
+    return {r["bucket"]: int(r["count"]) for r in RollupObject.query_all(**kwargs)}
+
+def summary(rollups=None, prefix=None):
+    return {rollup: read_rollup(rollup, prefix=prefix) for rollup in (rollups or SUMMARY_ROLLUPS)}
+
+def rebuild():
+    from orm import EventObject
+    counts = count_events(EventObject.scan_all())
+    table = RollupObject.TABLE()
+    for rollup in ROLLUPS:
+        for r in RollupObject.query_all(rollup=rollup):
+            table.delete_item(Key={"rollup": r["rollup"], "bucket": r["bucket"]})
+    for (rollup, bucket), n in counts.items():
+        table.put_item(Item={"rollup": rollup, "bucket": bucket, "count": n})
+    print(f"Rebuilt {len(counts)} rollup counters from {sum(n for (r, _), n in counts.items() if r == 'code')} events.")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        rebuild()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
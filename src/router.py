@@ -0,0 +1,178 @@
+"""
+Request dispatch indexed by the first segment of the path, instead of trying every route's regex in turn.
+
+PrefixRouter takes the same PathMatchers lambda_function already builds.  A route whose pattern starts with a literal
+segment (r"^/?events/...", r"^/?(?P<filename>static/dist/.*)$", r"^/?scrape/?$") only gets tried for paths starting
+with that segment; anything else (r".*debug.*", r"^.*/favicon.ico$") is a wildcard that gets tried for every path.
+Within a segment the routes keep their original order, wildcards included, so the first route that matches is the
+same one ListMatcher would have picked.
+
+Preprocessors that are LazyKwargs only do their parsing if the matched handler declares a parameter they might fill.
+"""
+
+import inspect
+import re
+
+# The start of a pattern that's a literal path segment: optional ^ and leading slash, then letters/digits/-/_, ending
+# at a slash or the end of the pattern.  An optional named group may open right before the segment.
+LITERAL_SEGMENT = re.compile(r"^\^?(?:/\?|/)?(?:\(\?P<\w+>)?([A-Za-z0-9_-]+)(?=/|\$|\)\$|\)?/)")
+ROOT_PATTERN = re.compile(r"^\^?(?:/\?|/)?\$$")
+
+def literal_prefix(pattern):
+    """
+    The first path segment every match of pattern must start with, or None if it could be anything.
+    """
+    if "|" in pattern:
+        return None
+    if ROOT_PATTERN.match(pattern):
+        return ""
+    m = LITERAL_SEGMENT.match(pattern)
+    return m.group(1) if m else None
+
+def first_segment(path):
+    return path.lstrip("/").split("/", 1)[0]
+
+def declared_kwargs(function):
+    """
+    The names a handler can take as keywords (past the decorators), or None if that can't be worked out.
+    """
+    try:
+        parameters = inspect.signature(inspect.unwrap(function)).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    return frozenset(p.name for p in parameters if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY))
+
+class LazyDict(dict):
+    """
+    A dict that isn't filled in until something looks inside it.
+    """
+    def __init__(self, load):
+        super().__init__()
+        self._load = load
+
+    def _fill(self):
+        if self._load is not None:
+            load, self._load = self._load, None
+            self.update(load() or {})
+
+    def __getitem__(self, key):
+        self._fill()
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self._fill()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self._fill()
+        return super().__iter__()
+
+    def __len__(self):
+        self._fill()
+        return super().__len__()
+
+    def __repr__(self):
+        self._fill()
+        return super().__repr__()
+
+    def get(self, key, default=None):
+        self._fill()
+        return super().get(key, default)
+
+    def keys(self):
+        self._fill()
+        return super().keys()
+
+    def items(self):
+        self._fill()
+        return super().items()
+
+    def values(self):
+        self._fill()
+        return super().values()
+
+class LazyKwargs(object):
+    """
+    A preprocessor that adds the mapping source(event) returns to the handler's kwargs, under name and key by key
+    (without overwriting anything already there).
+
+    Called plainly (by sneks' PathMatcher), or with only_declared=False, it does exactly that.  Otherwise PrefixRouter
+    passes the names the handler declares, and only those get copied in; if they're all filled already, source is never
+    called unless the handler reads kwargs[name].  Handlers that pass their **kwargs on (like ui_stuff.get_page, which
+    hands them to the template) need only_declared=False.
+    """
+    def __init__(self, name, source, only_declared=True):
+        self.name = name
+        self.source = source
+        self.only_declared = only_declared
+        self.__name__ = f"add_{name}_as_kwargs"
+
+    def __call__(self, info, wanted=None):
+        event = info["event"]
+        mapping = LazyDict(lambda: self.source(event))
+        info[self.name] = mapping
+        missing = None if wanted is None or not self.only_declared else wanted - set(info)
+        if missing is not None and not missing:
+            return info
+        for k in (mapping if missing is None else missing & set(mapping)):
+            if k not in info:
+                info[k] = mapping[k]
+        return info
+
+class Route(object):
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.regex = matcher.matcher
+        self.function = matcher.response_function
+        self.kwargs = matcher.kwargs
+        self.preprocessors = matcher.preprocessor_functions
+        self.prefix = literal_prefix(self.regex.pattern)
+        self.wanted = declared_kwargs(self.function)
+
+    def match(self, path, event):
+        m = self.regex.match(path)
+        if not m:
+            return None
+        kwargs = dict(self.kwargs)
+        kwargs.update(m.groupdict())
+        kwargs.setdefault("event", event)
+        for preprocessor in self.preprocessors:
+            if isinstance(preprocessor, LazyKwargs):
+                kwargs = preprocessor(kwargs, wanted=self.wanted)
+            else:
+                kwargs = preprocessor(kwargs)
+        return kwargs
+
+class PrefixRouter(object):
+    """
+    Drop-in for a ListMatcher over PathMatchers: match_event returns (function, kwargs) or (None, None), and
+    handle_event calls the function.
+    """
+    def __init__(self, matchers):
+        from sneks.sam import events
+        self.page_path = events.page_path
+        self.routes = [Route(m) for m in matchers]
+        self.wildcards = [r for r in self.routes if r.prefix is None]
+        self.by_prefix = {}
+        for prefix in set(r.prefix for r in self.routes if r.prefix is not None):
+            self.by_prefix[prefix] = [r for r in self.routes if r.prefix in (prefix, None)]
+
+    def candidates(self, path):
+        return self.by_prefix.get(first_segment(path), self.wildcards)
+
+    def match_event(self, event):
+        path = self.page_path(event)
+        for route in self.candidates(path):
+            kwargs = route.match(path, event)
+            if kwargs is not None:
+                return route.function, kwargs
+        return None, None
+
+    def handle_event(self, event):
+        function, kwargs = self.match_event(event)
+        if function:
+            return function(**kwargs)
+        return None
+
+    def describe(self):
+        return {(prefix or "/"): [r.regex.pattern for r in routes] for prefix, routes in sorted(self.by_prefix.items())}
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Adaptive polling: instead of fetching every NOAA feed on every cron tick, each feed gets its own poll interval.
+
+An interval doubles (up to a ceiling) each time its feed turns up nothing new, and drops to the feed's floor as soon as
+something new appears.  The ceilings come down as geomagnetic activity goes up.  The activity level (0 quiet to 3
+severe) is the highest of:
+- the number of alerts issued in the last ALERT_WINDOW;
+- the highest Kp in the latest 3-day forecast over the next OUTLOOK_HOURS;
+- that forecast's storm probabilities for the same period.
+
+A cron run only scrapes the feeds that are due.  With ADAPTIVE_SCHEDULE unset, every run scrapes everything as before.
+If SCHEDULE_RULE_NAME names the EventBridge rule that drives the cron, the rule's rate is also moved to the next time
+anything is due (between MIN_TICK and MAX_TICK), so quiet periods cost fewer invocations as well as fewer fetches.  That
+rate lives outside CloudFormation, so a stack update resets the rule to the template's schedule; the next run moves it back.
+
+It's off in the template.  Over the April 2023 storm (bench/schedule_sim.py), against the fixed 5-minute rule it halves feed
+fetches and gets storm alerts in 2 minutes instead of 5, but quiet-period alerts can take up to 10 minutes and the 3-day
+forecast up to 15, and the short floors during the storm cost more invocations than the quiet stretches save.  The ceilings
+below are what bound those latencies; raising them buys fewer invocations with slower pickup.
+
+The planning functions work on a plain dict, so bench/schedule_sim.py can replay a storm through them.  In Lambda the
+dict is a StateObject.
+
+    python3 src/scheduler.py show    # current intervals, next due times and activity level
+"""
+
+import argparse
+from datetime import datetime, timedelta
+import os
+import sys
+import threading
+import time
+import traceback
+
+ENABLED = os.environ.get("ADAPTIVE_SCHEDULE", "").lower() in ["1", "true", "yes"]
+RULE_NAME = os.environ.get("SCHEDULE_RULE_NAME")
+STATE_KEY = "schedule"
+
+# Scrape stage -> (shortest, longest) poll interval in seconds.
+FEEDS = {
+    "events": (2 * 60, 10 * 60),
+    "short-term forecast": (5 * 60, 15 * 60),
+    "long-term forecast": (3600, 24 * 3600),
+}
+BACKOFF = 2
+# Each activity level divides every feed's longest interval by this much (but never below its shortest).
+LEVEL_FACTOR = 3
+# A tick that arrives a little early still counts for a feed that's due just after it (the rule's rate is rounded to the
+# nearest minute, so this needs to be at least 30 seconds).
+SLACK = 30
+MIN_TICK = 60
+MAX_TICK = 30 * 60
+
+ALERT_WINDOW = 3 * 3600
+# (at least this many alerts in the window / this Kp / this storm probability, activity level)
+ALERT_LEVELS = [(6, 3), (3, 2), (1, 1)]
+KP_LEVELS = [(7, 3), (5, 2), (4, 1)]
+STORM_LEVELS = [(50, 1)]
+OUTLOOK_HOURS = 12
+
+def _level(value, thresholds):
+    for threshold, level in thresholds:
+        if value >= threshold:
+            return level
+    return 0
+
+def outlook_from_forecast(info):
+    """
+    The parts of a 3-day forecast (a ForecastObject from from_short_forecast) the scheduler needs: [start, Kp] for each
+    3-hour window and [start, highest storm probability] for each day, with starts as timestamps.
+    """
+    from orm import KP_KEY, STORM_KEY
+    kp = []
+    for day, windows in info.get(KP_KEY, {}).items():
+        midnight = datetime.strptime(day, "%Y/%m/%d")
+        for window, value in windows.items():
+            start = midnight + timedelta(hours=int(window[:2]))
+            kp.append([int(start.timestamp()), float(value)])
+    storm = []
+    for day, probabilities in info.get(STORM_KEY, {}).items():
+        if probabilities:
+            storm.append([int(datetime.strptime(day, "%Y/%m/%d").timestamp()), max(int(p) for p in probabilities.values())])
+    return {"issued": int(info["timestamp"]), "kp": sorted(kp), "storm": sorted(storm)}
+
+def activity_level(state, now):
+    alerts = sum(1 for t in state.get("alerts", []) if now - ALERT_WINDOW <= t <= now)
+    level = _level(alerts, ALERT_LEVELS)
+    outlook = state.get("outlook") or {}
+    horizon = now + OUTLOOK_HOURS * 3600
+    kp = [float(value) for start, value in outlook.get("kp", []) if now - 3 * 3600 < start <= horizon]
+    if kp:
+        level = max(level, _level(max(kp), KP_LEVELS))
+    storm = [int(value) for start, value in outlook.get("storm", []) if now - 24 * 3600 < start <= horizon]
+    if storm:
+        level = max(level, _level(max(storm), STORM_LEVELS))
+    return level
+
+def ceiling(feed, level):
+    shortest, longest = FEEDS[feed]
+    return max(shortest, longest // LEVEL_FACTOR ** level)
+
+def due(state, names, now):
+    """
+    The stages in names that should run at now.  Stages the scheduler doesn't know about always run.
+    """
+    feeds = state.get("feeds", {})
+    return [name for name in names if name not in FEEDS or int(feeds.get(name, {}).get("next_due", 0)) <= now + SLACK]
+
+def plan(state, results, now, alerts=(), outlook=None):
+    """
+    Updates state after a scrape and returns the number of seconds until the next run should happen.
+    results maps each stage that ran to True if it found new data, False if it didn't, or None if it failed.
+    alerts are the issue timestamps of any new events, and outlook a fresh outlook_from_forecast().
+    """
+    state["alerts"] = [int(t) for t in list(state.get("alerts", [])) + list(alerts) if int(t) > now - ALERT_WINDOW]
+    if outlook is not None:
+        state["outlook"] = outlook
+    level = activity_level(state, now)
+    feeds = state.setdefault("feeds", {})
+    for name, (shortest, _) in FEEDS.items():
+        feed = feeds.setdefault(name, {"interval": shortest, "next_due": 0, "polled": 0})
+        interval = int(feed["interval"])
+        cap = ceiling(name, level)
+        if name in results:
+            feed["polled"] = now
+            if results[name] is None:
+                # Failed: try again soon, without counting it as a quiet poll.
+                feed["next_due"] = now + shortest
+                continue
+            interval = shortest if results[name] else min(interval * BACKOFF, cap)
+            feed["interval"] = interval
+            feed["next_due"] = now + interval
+        elif interval > cap:
+            # Activity picked up since this feed was last polled; bring it forward.
+            feed["interval"] = cap
+            feed["next_due"] = min(int(feed["next_due"]), int(feed["polled"]) + cap)
+    state["level"] = level
+    wait = min(int(feed["next_due"]) for feed in feeds.values()) - now
+    return max(MIN_TICK, min(MAX_TICK, wait))
+
+def rule_expression(seconds):
+    minutes = max(1, round(seconds / 60))
+    return "rate(1 minute)" if minutes == 1 else f"rate({minutes} minutes)"
+
+EVENTS = None
+
+def events_client():
+    global EVENTS
+    if EVENTS is None:
+        import boto3
+        EVENTS = boto3.client("events")
+    return EVENTS
+
+def update_rule(state, seconds):
+    """
+    Moves the cron rule to a rate of seconds, if it isn't there already.  Description and enabled state are carried over,
+    since PutRule replaces whatever it isn't given.
+    """
+    if not RULE_NAME:
+        return False
+    expression = rule_expression(seconds)
+    try:
+        client = events_client()
+        # Checked against the rule itself rather than what was last set: a stack update puts the template's rate back.
+        rule = client.describe_rule(Name=RULE_NAME)
+        current = rule.get("ScheduleExpression")
+        if current != expression:
+            client.put_rule(Name=RULE_NAME, ScheduleExpression=expression, State=rule["State"], Description=rule.get("Description", ""))
+    except:
+        print(f"Unable to move {RULE_NAME} to {expression}!")
+        traceback.print_exc()
+        return False
+    state["rule"] = expression
+    if current == expression:
+        return False
+    print(f"Moved {RULE_NAME} from {current} to {expression}.")
+    return True
+
+# What the scrape stages turned up this run, gathered from their worker threads and folded into the state by record().
+_PENDING = {"alerts": [], "outlook": None}
+_LOCK = threading.Lock()
+
+def note_events(objs):
+    with _LOCK:
+        _PENDING["alerts"].extend(int(o["timestamp"]) for o in objs)
+
+def note_forecast(info):
+    outlook = outlook_from_forecast(info)
+    with _LOCK:
+        _PENDING["outlook"] = outlook
+
+def load_state():
+    from orm import StateObject
+    return StateObject.get_state(STATE_KEY)
+
+def due_stages(names):
+    if not ENABLED:
+        return list(names)
+    return due(load_state(), names, time.time())
+
+def record(results):
+    """
+    Plans the next run from a scrape's results (see plan()), saves it, and moves the cron rule if it's configured.
+    Returns the seconds until the next run, or None when adaptive scheduling is off.
+    """
+    with _LOCK:
+        alerts, outlook = _PENDING["alerts"], _PENDING["outlook"]
+        _PENDING["alerts"], _PENDING["outlook"] = [], None
+    if not ENABLED:
+        return None
+    now = int(time.time())
+    state = load_state()
+    wait = plan(state, results, now, alerts=alerts, outlook=outlook)
+    update_rule(state, wait)
+    state.save(force=True)
+    due_in = ", ".join(f"{name} in {int(feed['next_due']) - now}s" for name, feed in sorted(state["feeds"].items()))
+    print(f"Activity level {state['level']}; next run in {wait}s ({due_in}).")
+    return wait
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["show"])
+    parser.parse_args()
+    state = load_state()
+    now = int(time.time())
+    print(f"Activity level now: {activity_level(state, now)} (recorded {state.get('level', '-')}); rule: {state.get('rule', 'as deployed')}")
+    for name, feed in sorted(state.get("feeds", {}).items()):
+        print(f"{name:<22} every {int(feed['interval']):>6}s, due in {int(feed['next_due']) - now:>6}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""
+Full-text search over stored alerts, without scanning the EventTable.
+
+Every indexed event gets a small integer doc id (allocated with an atomic counter, and remembered per event key so indexing
+the same event again reuses it), and each term maps to the sorted list of doc ids it appears in.  Terms are the words of the
+message plus field terms like "station:boulder" built from the parsed data.  Doc blocks map each id back to its event's key and
+issue time, and results are ranked by issue time.
+Posting lists are stored as varint-encoded gaps between consecutive ids; the terms sharing their first two characters
+are kept together as one zlib-compressed blob in the StateTable, so a query touches one item per clause.
+
+Queries are whitespace-separated clauses that must all match:
+    boulder               a word anywhere in the message
+    geomag*               any word starting with "geomag" (at least two characters before the *)
+    station:boulder       a field filter; also code:, noaa_scale:, xray_class:, location:, optical_class:, warning_condition:
+    xray_class:x*         field filters take prefixes too
+"""
+
+import re
+import struct
+import time
+import zlib
+
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+
+from orm import EventObject, StateObject, EVENT_CACHE, make_key
+
+FIELDS = ["space_weather_message_code", "noaa_scale", "xray_class", "station", "location", "optical_class", "warning_condition"]
+FIELD_ALIASES = {"code": "space_weather_message_code", "x_ray_class": "xray_class"}
+SHORT_FIELD_NAMES = {"space_weather_message_code": "code"}
+# Boilerplate that's in (nearly) every message and would only bloat the index.
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "found", "from", "in", "is", "of", "on", "or", "the", "to",
+    "www", "swpc", "noaa", "gov", "space", "weather", "message", "code", "serial", "number", "issue", "time", "utc",
+    "scale", "descriptions", "explanation", "scales",
+])
+TOKEN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+SHARD_PREFIX_LENGTH = 2
+DOC_BLOCK_SIZE = 2048
+KEY_BUCKETS = 256
+# DynamoDB items top out at 400KB; leave room for the rest of the item.
+MAX_SHARD_BYTES = 350 * 1024
+MAX_RESULTS = 50
+
+META_KEY = "search:meta"
+
+def tokens(text):
+    return TOKEN.findall(text.lower())
+
+def event_terms(obj):
+    terms = set(t for t in tokens(obj.get("message", "")) if len(t) > 1 and t not in STOPWORDS)
+    data = obj.get("data", {})
+    for field in FIELDS:
+        value = data.get(field) if field in data else obj.get(field)
+        if isinstance(value, str):
+            name = SHORT_FIELD_NAMES.get(field, field)
+            terms.update(f"{name}:{t}" for t in tokens(value))
+    return terms
+
+def shard_name(term):
+    return f"search:index:{term[:SHARD_PREFIX_LENGTH]}"
+
+def doc_block_name(block):
+    return f"search:docs:{block}"
+
+def key_bucket_name(key_string):
+    return f"search:ids:{zlib.crc32(key_string.encode('utf-8')) % KEY_BUCKETS}"
+
+def doc_entry(obj):
+    return f"{obj.key_string}@{int(obj['timestamp'])}"
+
+def parse_doc_entry(entry):
+    # Entries written before issue times were kept are just the key, and rank below everything else until re-indexed.
+    key_string, _, timestamp = entry.partition("@")
+    return key_string, int(timestamp) if timestamp else 0
+
+# Posting lists: the first id, then the gap to each following id, each as a LEB128 varint.
+
+def encode_postings(ids):
+    out = bytearray()
+    last = 0
+    for i in ids:
+        gap = i - last
+        last = i
+        while gap >= 0x80:
+            out.append((gap & 0x7f) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+def decode_postings(data):
+    ids = []
+    last = 0
+    gap = 0
+    shift = 0
+    for b in data:
+        gap |= (b & 0x7f) << shift
+        if b & 0x80:
+            shift += 7
+            continue
+        last += gap
+        ids.append(last)
+        gap = 0
+        shift = 0
+    return ids
+
+def encode_shard(postings):
+    out = bytearray()
+    for term in sorted(postings):
+        t = term.encode("utf-8")
+        p = postings[term]
+        out += struct.pack(">HI", len(t), len(p)) + t + p
+    return zlib.compress(bytes(out), 9)
+
+def decode_shard(blob):
+    data = zlib.decompress(blob)
+    postings = {}
+    offset = 0
+    while offset < len(data):
+        tlen, plen = struct.unpack_from(">HI", data, offset)
+        offset += 6
+        term = data[offset:offset+tlen].decode("utf-8")
+        offset += tlen
+        postings[term] = data[offset:offset+plen]
+        offset += plen
+    return postings
+
+def _load_blob_item(name):
+    obj = StateObject.load(state_key=name)
+    if not obj or "blob" not in obj:
+        return {}, None
+    return decode_shard(bytes(obj["blob"].value)), obj.get("version")
+
+def _save_blob_item(name, postings, old_version):
+    # Raw bytes don't survive the ORM's JSON-based save, so this writes the item directly, guarded by its version.
+    blob = encode_shard(postings)
+    if len(blob) > MAX_SHARD_BYTES:
+        raise RuntimeError(f"Search shard {name} would be {len(blob)} bytes, over the {MAX_SHARD_BYTES} byte limit; "
+                           f"raise SHARD_PREFIX_LENGTH and rebuild the index.")
+    item = {"state_key": name, "blob": Binary(blob), "terms": len(postings), "version": (old_version or 0) + 1, "updated": int(time.time())}
+    condition = Attr("version").not_exists() if old_version is None else Attr("version").eq(old_version)
+    StateObject.TABLE().put_item(Item=item, ConditionExpression=condition)
+
+def load_shard(name):
+    return EVENT_CACHE.get_or_load(make_key("search_shard", shard=name), lambda: _load_blob_item(name)[0])
+
+def allocate_doc_ids(n):
+    response = StateObject.TABLE().update_item(
+        Key={"state_key": META_KEY},
+        UpdateExpression="ADD next_doc :n",
+        ExpressionAttributeValues={":n": n},
+        ReturnValues="ALL_NEW",
+    )
+    end = int(response["Attributes"]["next_doc"])
+    return list(range(end - n, end))
+
+def _retry_conditional(func, max_attempts=5):
+    # Concurrent writers (the cron and a backfill, say) lose the version check and just go around again.
+    for attempt in range(max_attempts):
+        try:
+            return func()
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException" or attempt == max_attempts - 1:
+                raise
+
+def _update_blob_item(name, update):
+    def attempt():
+        postings, version = _load_blob_item(name)
+        update(postings)
+        _save_blob_item(name, postings, version)
+    _retry_conditional(attempt)
+
+def assign_doc_ids(objs):
+    """
+    Doc ids for objs: the ones they were given before if they've been indexed already (a retried scrape, or a resumed
+    backfill), otherwise new ones.  New ids are recorded before anything else is written, so a run that dies part way
+    through is finished off under the same ids next time rather than indexed twice.
+    """
+    by_bucket = {}
+    for obj in objs:
+        by_bucket.setdefault(key_bucket_name(obj.key_string), []).append(obj.key_string)
+    known = {}
+    for name, keys in by_bucket.items():
+        ids = StateObject.get_state(name).get("ids", {})
+        known.update({k: int(ids[k]) for k in keys if k in ids})
+    new_keys = [obj.key_string for obj in objs if obj.key_string not in known]
+    if new_keys:
+        fresh = dict(zip(new_keys, allocate_doc_ids(len(new_keys))))
+        for name, keys in by_bucket.items():
+            claimed = {k: fresh[k] for k in keys if k in fresh}
+            if not claimed:
+                continue
+            def add_ids(name=name, claimed=claimed):
+                state = StateObject.get_state(name)
+                state["ids"] = dict(claimed, **state.get("ids", {}))
+                state.save()
+            _retry_conditional(add_ids)
+            # Another writer may have claimed some of these keys first; theirs win.
+            ids = StateObject.get_state(name)["ids"]
+            known.update({k: int(ids[k]) for k in claimed})
+    return [known[obj.key_string] for obj in objs]
+
+def index_events(objs):
+    """
+    Adds newly ingested events to the index.  Re-indexing an event that's already there is harmless.  Returns the number
+    of terms touched.
+    """
+    objs = list({obj.key_string: obj for obj in objs}.values())
+    if not objs:
+        return 0
+    ids = assign_doc_ids(objs)
+
+    by_block = {}
+    for doc_id, obj in zip(ids, objs):
+        by_block.setdefault(doc_id // DOC_BLOCK_SIZE, {})[str(doc_id % DOC_BLOCK_SIZE)] = doc_entry(obj)
+    for block, docs in by_block.items():
+        # Doc blocks are plain string maps, so they go through the ORM and just get merged in.
+        def add_docs(docs=docs, block=block):
+            state = StateObject.get_state(doc_block_name(block))
+            state["docs"] = dict(state.get("docs", {}), **docs)
+            state.save()
+        _retry_conditional(add_docs)
+
+    by_shard = {}
+    for doc_id, obj in zip(ids, objs):
+        for term in event_terms(obj):
+            by_shard.setdefault(shard_name(term), {}).setdefault(term, []).append(doc_id)
+    for name, new_postings in by_shard.items():
+        def merge(postings, new_postings=new_postings):
+            for term, new_ids in new_postings.items():
+                existing = decode_postings(postings.get(term, b""))
+                postings[term] = encode_postings(sorted(set(existing) | set(new_ids)))
+        _update_blob_item(name, merge)
+    return sum(len(p) for p in by_shard.values())
+
+def parse_query(q):
+    """
+    Splits a query into (term, is_prefix) clauses, normalized the same way indexing does.
+    """
+    clauses = []
+    for raw in q.lower().split():
+        prefix = raw.endswith("*")
+        raw = raw.rstrip("*")
+        field = None
+        if ":" in raw:
+            field, raw = raw.split(":", 1)
+            field = FIELD_ALIASES.get(field, field)
+            field = SHORT_FIELD_NAMES.get(field, field)
+        parts = tokens(raw)
+        for i, token in enumerate(parts):
+            term = f"{field}:{token}" if field else token
+            if not field and token in STOPWORDS:
+                continue
+            # Only the last token of a clause can be a prefix; "x-ray*" means "x" and "ray*".
+            is_prefix = prefix and i == len(parts) - 1
+            if len(term) < SHARD_PREFIX_LENGTH:
+                continue
+            clauses.append((term, is_prefix))
+    return clauses
+
+def matching_ids(term, is_prefix):
+    postings = load_shard(shard_name(term))
+    if not is_prefix:
+        return set(decode_postings(postings.get(term, b"")))
+    ids = set()
+    for t, p in postings.items():
+        if t.startswith(term):
+            ids.update(decode_postings(p))
+    return ids
+
+def search(q, limit=MAX_RESULTS):
+    """
+    Events matching every clause of the query, newest first.  Returns (events, total matches).
+    """
+    clauses = parse_query(q)
+    if not clauses:
+        return [], 0
+    ids = None
+    for term, is_prefix in clauses:
+        found = matching_ids(term, is_prefix)
+        ids = found if ids is None else ids & found
+        if not ids:
+            return [], 0
+    # Doc ids follow ingest order, which a backfill of old archives breaks, so the newest are picked by issue time.  That
+    # means reading the doc block of every match, but a block covers DOC_BLOCK_SIZE ids and they're cached.
+    docs = []
+    blocks = {}
+    for doc_id in ids:
+        block = doc_id // DOC_BLOCK_SIZE
+        if block not in blocks:
+            blocks[block] = EVENT_CACHE.get_or_load(make_key("search_docs", block=block), lambda: StateObject.get_state(doc_block_name(block)).get("docs", {}))
+        entry = blocks[block].get(str(doc_id % DOC_BLOCK_SIZE))
+        if entry:
+            key, timestamp = parse_doc_entry(entry)
+            docs.append((timestamp, doc_id, key))
+    keys = []
+    for _, _, key in sorted(docs, reverse=True):
+        if len(keys) >= limit:
+            break
+        if key not in keys:
+            keys.append(key)
+    events = EventObject.batch_load([EventObject.key_from_string(k) for k in keys])
+    events.sort(key=lambda e: e["timestamp"], reverse=True)
+    return events, len(ids)
+
+def rebuild(batch_size=500):
+    """
+    One-off: indexes every event already in the EventTable, oldest first.  Run it against an empty index, or over an existing
+    one to add issue times to doc entries written without them (ids are reused, so nothing is indexed twice).
+    """
+    events = sorted(EventObject.scan_all(), key=lambda e: e["timestamp"])
+    for i in range(0, len(events), batch_size):
+        index_events(events[i:i+batch_size])
+    return len(events)
@@ -0,0 +1,189 @@
+"""
+Pre-rendered copies of the event pages, written by the scraper right after it ingests new events.
+
+Materialization is off unless one of these is set:
+    SNAPSHOT_BUCKET (+ optional SNAPSHOT_PREFIX): store snapshots in S3.  The function role needs s3:GetObject/PutObject on it.
+    SNAPSHOT_DIR: store snapshots on the local filesystem instead (handy locally; in Lambda it's only visible to the one container).
+
+Pages are rendered with a placeholder for the base/static paths, which gets swapped for the real ones when the snapshot is served,
+so the same snapshot works behind any API Gateway stage or custom domain.
+
+Each snapshot can carry a time after which it's no longer served, and requests fall back to the live page instead.  The list
+pages get LIST_SNAPSHOT_TTL seconds: they're built partly from queries that can lag the writes just before them, so a bad render
+only lasts until the next ingest or the TTL, whichever comes first.  Any page also stops being served once an alert it shows
+as active runs past its validity window, since the live page would show it as expired.
+"""
+
+import os
+import time
+import traceback
+
+from bs4 import BeautifulSoup
+from sneks.sam import events as sam_events, ui_stuff
+from sneks.sam.response_core import make_response
+
+import assets
+
+PATH_PLACEHOLDER = "__CARRINGTON_BASE_PATH__"
+STATIC_PLACEHOLDER = "__CARRINGTON_STATIC_BASE__"
+LIST_SNAPSHOT_TTL = int(os.environ.get("LIST_SNAPSHOT_TTL", 0) or 900)
+VALID_UNTIL_PREFIX = "<!-- snapshot valid until "
+VALID_UNTIL_SUFFIX = " -->\n"
+
+class FileStore(object):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def read(self, name):
+        try:
+            with open(self._path(name)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, name, body):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so a page being served never sees a half-written file.
+        with open(path + ".tmp", "w") as f:
+            f.write(body)
+        os.replace(path + ".tmp", path)
+
+class S3Store(object):
+    def __init__(self, bucket, prefix="snapshots", client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3")
+        return self._client
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def read(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"].read().decode("utf-8")
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def write(self, name, body):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=body.encode("utf-8"), ContentType="text/html")
+
+STORE = None
+
+def get_store():
+    global STORE
+    if STORE is None:
+        if os.environ.get("SNAPSHOT_BUCKET"):
+            STORE = S3Store(os.environ["SNAPSHOT_BUCKET"], os.environ.get("SNAPSHOT_PREFIX", "snapshots"))
+        elif os.environ.get("SNAPSHOT_DIR"):
+            STORE = FileStore(os.environ["SNAPSHOT_DIR"])
+    return STORE
+
+def list_name():
+    return "events/list.html"
+
+def list_code_name(space_weather_message_code):
+    return f"events/{space_weather_message_code}.html"
+
+def view_name(space_weather_message_code, serial_number):
+    return f"events/{space_weather_message_code}/{serial_number}.html"
+
+def render(template_name, **params):
+    assets.install()
+    params = ui_stuff.get_params(template_name, None, base_path=PATH_PLACEHOLDER, static_base=STATIC_PLACEHOLDER, **params)
+    body = ui_stuff.env.get_template(template_name).render(**params)
+    # Same prettification make_response would do, done once here instead of on every request.
+    return BeautifulSoup(body, features="html.parser").prettify()
+
+def stamp(body, valid_until=None):
+    if valid_until is None:
+        return body
+    return f"{VALID_UNTIL_PREFIX}{int(valid_until)}{VALID_UNTIL_SUFFIX}{body}"
+
+def unstamp(body):
+    """
+    (body, valid until) for a stored snapshot; valid until is None for snapshots that don't expire.
+    """
+    if not body.startswith(VALID_UNTIL_PREFIX):
+        return body, None
+    stamp, _, body = body[len(VALID_UNTIL_PREFIX):].partition(VALID_UNTIL_SUFFIX)
+    return body, int(stamp)
+
+def serve(event, name):
+    store = get_store()
+    if not store:
+        return None
+    try:
+        body = store.read(name)
+    except:
+        traceback.print_exc()
+        return None
+    if body is None:
+        return None
+    body, valid_until = unstamp(body)
+    if valid_until is not None and valid_until <= time.time():
+        return None
+    body = body.replace(PATH_PLACEHOLDER, sam_events.base_path(event)).replace(STATIC_PLACEHOLDER, sam_events.static_path(event) or "")
+    return make_response(body, headers={"Content-Type": "text/html"}, prettify_html=False)
+
+def status_change(events, now):
+    """
+    When the first of events that are active at now expires, or None if none of them will.
+    """
+    expiries = [e["expires_at"] for e in events if e.is_active(now) and e.get("expires_at") is not None]
+    return min(expiries) if expiries else None
+
+def earliest(*times):
+    times = [t for t in times if t is not None]
+    return min(times) if times else None
+
+def first_page(response, written):
+    """
+    The items of the first page of a newest-first event query, with the events just written merged in over whatever the
+    query returned for them, since the query may not see those writes yet.  Written events older than the page's last item
+    belong on a later page and are left out.
+    """
+    items = {e.key_string: e for e in response["Items"]}
+    oldest = min(e["timestamp"] for e in items.values()) if items and response["NextToken"] else None
+    for e in written:
+        if oldest is None or e["timestamp"] >= oldest:
+            items[e.key_string] = e
+    return sorted(items.values(), key=lambda e: (e["timestamp"], e["serial_number"]), reverse=True)
+
+def materialize(new_events):
+    """
+    Re-renders only the pages that the newly ingested events show up on: the first page of the full list,
+    the first page of each affected message code's list, and each given event's own page (new events, plus any earlier
+    events whose chain they joined).
+    """
+    store = get_store()
+    if not store or not new_events:
+        return 0
+    from chains import load_chain
+    from orm import EventObject
+    pages = {}
+    now = time.time()
+    response = EventObject.query_chronological()
+    events = first_page(response, new_events)
+    pages[list_name()] = (render("events/list.html", events=events, next_token=response["NextToken"]), earliest(now + LIST_SNAPSHOT_TTL, status_change(events, now)))
+    for code in sorted(set(e["space_weather_message_code"] for e in new_events)):
+        response = EventObject.query(space_weather_message_code=code, ScanIndexForward=False)
+        events = first_page(response, [e for e in new_events if e["space_weather_message_code"] == code])
+        pages[list_code_name(code)] = (render("events/list_code.html", events=events, next_token=response["NextToken"], space_weather_message_code=code), earliest(now + LIST_SNAPSHOT_TTL, status_change(events, now)))
+    for e in new_events:
+        code, serial = e["space_weather_message_code"], e["serial_number"]
+        chain = load_chain(e)
+        pages[view_name(code, serial)] = (render("events/view.html", _event=e, chain=chain, space_weather_message_code=code, serial_number=serial), status_change(chain, now))
+    for name, (body, valid_until) in pages.items():
+        store.write(name, stamp(body, valid_until))
+    print(f"Materialized {len(pages)} page snapshots.")
+    return len(pages)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Notification subscribers and fan-out.
+
+Each subscriber has a channel (text/email/page), a target, a latitude threshold and optional message-code prefixes.  An event
+reaches a subscriber when its impact area ("primarily poleward of N degrees") extends below the subscriber's threshold.
+Subscribers are held in memory sorted by threshold, so the ones an event reaches are a bisect plus a slice.
+Every notification goes out through publish(), which batches per target and retries whatever fails.
+
+The stock text and email SNS topics are always subscribed at 51 degrees, matching the behaviour before per-subscriber targeting.
+
+    python3 src/subscribers.py add --channel text --target +15555550100 --threshold 55 --codes ALTK WATA
+    python3 src/subscribers.py list
+    python3 src/subscribers.py remove <subscriber_id>
+"""
+
+import argparse
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import sys
+import time
+import traceback
+import uuid
+
+from cache import TTLCache
+import metrics
+
+CHANNELS = ["text", "email", "page"]
+DEFAULT_THRESHOLD = 51
+# Events that don't say how far the impact reaches are treated as polar-only.
+DEFAULT_LATITUDE = 90
+PUBLISH_CONCURRENCY = int(os.environ.get("PUBLISH_CONCURRENCY", 0) or 8)
+PUBLISH_BATCH_SIZE = 10  # SNS PublishBatch limit
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.2
+INDEX_TTL = int(os.environ.get("SUBSCRIBER_INDEX_TTL", 0) or 60)
+
+def default_subscribers():
+    return [
+        {"subscriber_id": "default-text", "channel": "text", "target": os.environ["TEXT_TOPIC_ARN"], "latitude_threshold": DEFAULT_THRESHOLD, "codes": []},
+        {"subscriber_id": "default-email", "channel": "email", "target": os.environ["EMAIL_TOPIC_ARN"], "latitude_threshold": DEFAULT_THRESHOLD, "codes": []},
+    ]
+
+def event_latitude(obj):
+    return obj.get("data", {}).get("latitude", DEFAULT_LATITUDE)
+
+class SubscriberIndex(object):
+    def __init__(self, subscribers):
+        subscribers = sorted(subscribers, key=lambda s: s["latitude_threshold"])
+        self.thresholds = [s["latitude_threshold"] for s in subscribers]
+        self.subscribers = subscribers
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def match(self, obj):
+        # Everyone whose threshold is strictly above the event's latitude, then the (usually short) code filter.
+        start = bisect_right(self.thresholds, event_latitude(obj))
+        code = obj["space_weather_message_code"]
+        return [s for s in self.subscribers[start:] if not s.get("codes") or any(code.startswith(c) for c in s["codes"])]
+
+INDEX_CACHE = TTLCache(maxsize=1, ttl=INDEX_TTL)
+
+def load_index():
+    from orm import SubscriberObject
+    subscribers = default_subscribers()
+    for s in SubscriberObject.scan_all():
+        if s.get("enabled", True):
+            subscribers.append(s)
+    return SubscriberIndex(subscribers)
+
+def get_index():
+    return INDEX_CACHE.get_or_load("index", load_index)
+
+def deliveries(matches, messages):
+    """
+    Pairs each matched subscriber with the message for its channel.  messages maps channel -> (body, subject).
+    """
+    return [(s, messages[s["channel"]]) for s in matches if s["channel"] in messages]
+
+@metrics.timed("sns.publish")
+def publish_message(client, target, body, subject=None):
+    kwargs = {"TopicArn": target} if target.startswith("arn:") else {"PhoneNumber": target}
+    if subject:
+        kwargs["Subject"] = subject
+    return client.publish(Message=body, **kwargs)
+
+def _publish_batch(client, target, batch):
+    """
+    Sends [(body, subject)] to one target and returns the positions in batch that went out.
+    """
+    if len(batch) == 1 or not target.startswith("arn:"):
+        # Phone numbers can only be published to one message at a time.
+        sent = set()
+        for i, (body, subject) in enumerate(batch):
+            try:
+                publish_message(client, target, body, subject)
+                sent.add(i)
+            except:
+                print(f"Publish to {target} failed!")
+                traceback.print_exc()
+        return sent
+    entries = []
+    for i, (body, subject) in enumerate(batch):
+        entry = {"Id": str(i), "Message": body}
+        if subject:
+            entry["Subject"] = subject
+        entries.append(entry)
+    with metrics.span("sns.publish_batch"):
+        response = client.publish_batch(TopicArn=target, PublishBatchRequestEntries=entries)
+    for failure in response.get("Failed", []):
+        print(f"Publish to {target} failed: {failure}")
+    return set(int(s["Id"]) for s in response.get("Successful", []))
+
+def _publish_with_retry(client, target, batch, max_attempts=MAX_ATTEMPTS):
+    """
+    _publish_batch, going around again (with exponential backoff) for whatever didn't go out.  Only the failed messages are
+    resent, so nothing is published twice.
+    """
+    remaining = list(range(len(batch)))
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(BACKOFF_BASE * (2 ** attempt) * (1 + random.random()))
+        try:
+            sent = _publish_batch(client, target, [batch[i] for i in remaining])
+        except:
+            print(f"Unable to publish to {target}!")
+            traceback.print_exc()
+            sent = set()
+        remaining = [i for j, i in enumerate(remaining) if j not in sent]
+        if not remaining:
+            break
+    if remaining:
+        print(f"Giving up on {len(remaining)} messages to {target} after {max_attempts} attempts.")
+    return set(range(len(batch))) - set(remaining)
+
+def publish(client, pending, concurrency=None):
+    """
+    Sends (subscriber, (body, subject)) pairs, grouped per target into PublishBatch-sized batches, a bounded number at a time,
+    retrying failures with exponential backoff.  Returns a list of whether each pair was sent, in the order given.
+    """
+    concurrency = concurrency if concurrency else PUBLISH_CONCURRENCY
+    by_target = {}
+    for position, (subscriber, message) in enumerate(pending):
+        by_target.setdefault(subscriber["target"], []).append((position, message))
+    batches = []
+    for target, messages in by_target.items():
+        for i in range(0, len(messages), PUBLISH_BATCH_SIZE):
+            batches.append((target, messages[i:i+PUBLISH_BATCH_SIZE]))
+    delivered = [False] * len(pending)
+    if not batches:
+        return delivered
+
+    def send(batch):
+        target, messages = batch
+        sent = _publish_with_retry(client, target, [message for _, message in messages])
+        return [position for j, (position, _) in enumerate(messages) if j in sent]
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+        for positions in pool.map(send, batches):
+            for position in positions:
+                delivered[position] = True
+    print(f"Published {sum(delivered)} of {len(pending)} notifications in {len(batches)} batches.")
+    return delivered
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add")
+    add.add_argument("--channel", choices=CHANNELS, required=True)
+    add.add_argument("--target", required=True, help="SNS topic ARN, or a phone number for texts")
+    add.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="notify for impact areas reaching below this geomagnetic latitude")
+    add.add_argument("--codes", nargs="*", default=[], help="only notify for message codes starting with one of these")
+    commands.add_parser("list")
+    remove = commands.add_parser("remove")
+    remove.add_argument("subscriber_id")
+    args = parser.parse_args()
+
+    from orm import SubscriberObject
+    if args.command == "add":
+        if args.channel != "text" and not args.target.startswith("arn:"):
+            parser.error("only texts can go straight to a phone number; other channels need an SNS topic ARN")
+        subscriber = SubscriberObject(subscriber_id=str(uuid.uuid4()), channel=args.channel, target=args.target, latitude_threshold=args.threshold, codes=args.codes, enabled=True)
+        subscriber.save()
+        print(subscriber["subscriber_id"])
+    elif args.command == "list":
+        for s in sorted(SubscriberObject.scan_all(), key=lambda s: s["latitude_threshold"]):
+            print(f"{s['subscriber_id']}  {s['channel']:<6} {s['latitude_threshold']:>5}  {','.join(s.get('codes', [])) or '*':<20} {s['target']}")
+    elif args.command == "remove":
+        subscriber = SubscriberObject.load(subscriber_id=args.subscriber_id)
+        if not subscriber:
+            print(f"No subscriber {args.subscriber_id}.")
+            return 1
+        subscriber.delete()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
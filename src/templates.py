@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Build-time precompilation of the Jinja templates, so a cold container doesn't lex, parse and generate code for every page
+(and base.html.jinja, which they all extend) on its first render.
+
+The build compiles jinja_templates/ into Python modules (and their .pyc files) in the bundle:
+
+    python3 src/templates.py compile build/compiled_templates
+
+and at runtime install() puts a ModuleLoader over them in front of sneks' FileSystemLoader.  Templates that weren't
+precompiled (or a bundle built without the step) fall back to compiling from source as before.
+"""
+
+import argparse
+import compileall
+import os
+import sys
+
+from jinja2 import ChoiceLoader, Environment, FileSystemLoader, ModuleLoader
+
+import metrics
+
+COMPILED_DIRNAME = "compiled_templates"
+SOURCE_DIRNAME = "jinja_templates"
+
+class PrecompiledLoader(ChoiceLoader):
+    """
+    Compiled modules first, then the source templates.  ModuleLoader can't list what it has, so listing (for the debug
+    page) goes to the source loader.
+    """
+    def __init__(self, compiled_dir, source_loader):
+        super().__init__([ModuleLoader(compiled_dir), source_loader])
+        self.compiled_dir = compiled_dir
+        self.source_loader = source_loader
+
+    def list_templates(self):
+        return self.source_loader.list_templates()
+
+def compiled_dir(root=None):
+    return os.path.join(root or os.environ["LAMBDA_TASK_ROOT"], COMPILED_DIRNAME)
+
+def install(env=None, root=None):
+    """
+    Switches env (sneks' shared environment by default) over to the precompiled templates, if the bundle has them.
+    Returns whether it did.
+    """
+    if env is None:
+        from sneks.sam import ui_stuff
+        env = ui_stuff.env
+    path = compiled_dir(root)
+    if isinstance(env.loader, PrecompiledLoader) or not os.path.isdir(path):
+        return False
+    env.loader = PrecompiledLoader(path, env.loader)
+    env.cache.clear()
+    return True
+
+def meter(env=None):
+    """
+    Times every render through env (sneks' shared environment by default) as the "render" metrics span.
+    """
+    if env is None:
+        from sneks.sam import ui_stuff
+        env = ui_stuff.env
+    if getattr(env.template_class, "metered", False):
+        return
+    base = env.template_class
+
+    class MeteredTemplate(base):
+        metered = True
+
+        def render(self, *args, **kwargs):
+            with metrics.span("render"):
+                return super().render(*args, **kwargs)
+
+    env.template_class = MeteredTemplate
+    env.cache.clear()
+
+def compile_all(target, source=SOURCE_DIRNAME):
+    """
+    Compiles every template under source into target.  Uses a plain Environment with sneks' settings, so the generated
+    code matches what ui_stuff.env would have produced at runtime.
+    """
+    env = Environment(loader=FileSystemLoader(source))
+    names = env.list_templates()
+    os.makedirs(target, exist_ok=True)
+    env.compile_templates(target, zip=None, ignore_errors=False, log_function=None)
+    # Precompiled bytecode only helps if the build's Python matches the Lambda runtime; otherwise it's just ignored.
+    compileall.compile_dir(target, quiet=1)
+    return names
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["compile"])
+    parser.add_argument("target", nargs="?", default=os.path.join("build", COMPILED_DIRNAME))
+    parser.add_argument("--source", default=SOURCE_DIRNAME)
+    args = parser.parse_args()
+    names = compile_all(args.target, args.source)
+    print(f"Compiled {len(names)} templates into {args.target}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Columnar Kp/Ap/radio-flux forecast history, kept alongside the per-forecast ForecastObject items.
+
+Every forecast value becomes one row of a packed NumPy record array (kind, product, 3-hour window, target day, issue time, value).
+Rows are grouped by the target day's year, and each year is stored as one zlib-compressed blob in the StateTable,
+so range and aggregate questions load a handful of items and run as array operations instead of walking every forecast dict.
+"""
+
+import time
+import zlib
+
+import numpy as np
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import Binary
+from botocore.exceptions import ClientError
+
+from orm import StateObject, ForecastObject, AP_KEY, KP_KEY, RF_KEY
+
+KP = 0
+AP = 1
+RF = 2
+KINDS = {"kp": KP, "ap": AP, "rf": RF}
+
+SHORT = 0      # 3-day geomagnetic forecast
+MONTH = 1      # 27-day outlook
+OBSERVED = 2   # "Observed Ap" line of the 3-day forecast (the day before it was issued)
+ESTIMATED = 3  # "Estimated Ap" line of the 3-day forecast (the day it was issued)
+PRODUCTS = {"short": SHORT, "month": MONTH, "observed": OBSERVED, "estimated": ESTIMATED}
+
+DAILY = -1
+
+DTYPE = np.dtype([
+    ("kind", "i1"),
+    ("product", "i1"),
+    ("window", "i1"),
+    ("day", "i4"),
+    ("issued", "i8"),
+    ("value", "f4"),
+])
+KEY_FIELDS = ["kind", "product", "window", "day", "issued"]
+
+def day_number(date_s):
+    # "2023/04/24" -> days since 1970-01-01
+    return int(np.datetime64(date_s.replace("/", "-"), "D").astype(np.int64))
+
+def day_string(day):
+    return str(np.datetime64(int(day), "D")).replace("-", "/")
+
+def rows_from_forecast(info, product):
+    issued = int(float(info["timestamp"]))
+    issued_day = issued // 86400
+    rows = []
+    for date_s, windows in info.get(KP_KEY, {}).items():
+        day = day_number(date_s)
+        if isinstance(windows, dict):
+            for window, value in windows.items():
+                # "00-03UT" -> 0, ... "21-24UT" -> 7
+                rows.append((KP, product, int(window[:2]) // 3, day, issued, float(value)))
+        else:
+            rows.append((KP, product, DAILY, day, issued, float(windows)))
+    for date_s, value in info.get(AP_KEY, {}).items():
+        day = day_number(date_s)
+        ap_product = product
+        if product == SHORT and day < issued_day:
+            ap_product = OBSERVED
+        elif product == SHORT and day == issued_day:
+            ap_product = ESTIMATED
+        rows.append((AP, ap_product, DAILY, day, issued, float(value)))
+    for date_s, value in info.get(RF_KEY, {}).items():
+        rows.append((RF, product, DAILY, day_number(date_s), issued, float(value)))
+    return np.array(rows, dtype=DTYPE)
+
+class ForecastSeries(object):
+    def __init__(self, rows=None):
+        self.rows = rows if rows is not None else np.zeros(0, dtype=DTYPE)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        return cls(np.frombuffer(zlib.decompress(blob), dtype=DTYPE).copy())
+
+    def to_bytes(self):
+        return zlib.compress(self.rows.tobytes(), 9)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def extend(self, rows):
+        rows = np.concatenate([self.rows, rows])
+        # Re-adding a forecast we already have keeps the newest copy of each (kind, product, window, day, issued) row.
+        _, first = np.unique(rows[KEY_FIELDS][::-1], return_index=True)
+        rows = rows[::-1][first]
+        self.rows = rows[np.lexsort((rows["window"], rows["issued"], rows["day"]))]
+        return self
+
+    def select(self, kind, product=None, start=None, end=None, window=None):
+        rows = self.rows
+        mask = rows["kind"] == kind
+        if product is not None:
+            mask &= rows["product"] == product
+        if start is not None:
+            mask &= rows["day"] >= start
+        if end is not None:
+            mask &= rows["day"] <= end
+        if window is not None:
+            mask &= rows["window"] == window
+        return rows[mask]
+
+    def daily_max(self, kind=KP, product=None, start=None, end=None):
+        """
+        Highest forecast value per target day.  Returns (days, values) arrays.
+        """
+        rows = self.select(kind, product=product, start=start, end=end)
+        if not len(rows):
+            return np.zeros(0, dtype="i4"), np.zeros(0, dtype="f4")
+        # rows are kept sorted by day, so each day is one contiguous run
+        days, starts = np.unique(rows["day"], return_index=True)
+        return days, np.maximum.reduceat(rows["value"], starts)
+
+    def drift(self, day, kind=KP, product=MONTH):
+        """
+        How the forecast for one target day changed as it got closer.  Returns (issued, values) arrays, oldest issue first.
+        For 3-hour Kp windows the daily maximum of each issue is used.
+        """
+        rows = self.select(kind, product=product, start=day, end=day)
+        if not len(rows):
+            return np.zeros(0, dtype="i8"), np.zeros(0, dtype="f4")
+        rows = rows[np.argsort(rows["issued"], kind="stable")]
+        issued, starts = np.unique(rows["issued"], return_index=True)
+        return issued, np.maximum.reduceat(rows["value"], starts)
+
+def _state_key(year):
+    return f"forecast_series:{year}"
+
+def _year(day):
+    return int(_years(np.array([day]))[0])
+
+def _years(days):
+    return days.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+
+def load_year(year):
+    obj = StateObject.load(state_key=_state_key(year))
+    if not obj or "blob" not in obj:
+        return ForecastSeries(), None
+    return ForecastSeries.from_bytes(bytes(obj["blob"].value)), obj.get("version")
+
+def load_range(start, end):
+    years = range(_year(start), _year(end) + 1)
+    parts = [load_year(year)[0].rows for year in years]
+    return ForecastSeries(np.concatenate(parts) if parts else None)
+
+def _save_year(year, series, old_version):
+    # The blob is raw bytes, which the ORM's JSON-based save can't carry, so this writes the item directly.
+    # The version check stops the two forecast scrapes (which run concurrently) from clobbering each other's rows.
+    item = {"state_key": _state_key(year), "blob": Binary(series.to_bytes()), "rows": len(series), "version": (old_version or 0) + 1, "updated": int(time.time())}
+    condition = Attr("version").not_exists() if old_version is None else Attr("version").eq(old_version)
+    StateObject.TABLE().put_item(Item=item, ConditionExpression=condition)
+
+def append(rows, max_attempts=5):
+    years = _years(rows["day"])
+    for year in np.unique(years):
+        year_rows = rows[years == year]
+        for attempt in range(max_attempts):
+            series, version = load_year(year)
+            series.extend(year_rows)
+            try:
+                _save_year(year, series, version)
+                break
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException" or attempt == max_attempts - 1:
+                    raise
+
+def add_forecast(info, product):
+    rows = rows_from_forecast(info, product)
+    if len(rows):
+        append(rows)
+    return rows
+
+def rebuild():
+    """
+    One-off: rebuilds every year's series from the ForecastTable.
+    """
+    parts = []
+    for info in ForecastObject.scan_all():
+        product = MONTH if "27-day" in info["product"] else SHORT
+        parts.append(rows_from_forecast(info, product))
+    rows = np.concatenate(parts) if parts else np.zeros(0, dtype=DTYPE)
+    years = _years(rows["day"])
+    for year in np.unique(years):
+        series = ForecastSeries().extend(rows[years == year])
+        _, version = load_year(year)
+        _save_year(year, series, version)
+    return len(rows)
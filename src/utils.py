@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
 from functools import update_wrapper
+import importlib.util
+import os
+import sys
 
 def log_function(func):
     def newfunc(*args, **kwargs):
@@ -11,3 +14,23 @@ def log_function(func):
             print("Exiting function '{}'".format(func.__name__))
     update_wrapper(newfunc, func)
     return newfunc
+
+
+# Set EAGER_IMPORTS=1 to import everything up front, e.g. to compare cold starts against the lazy default.
+EAGER_IMPORTS = bool(os.environ.get("EAGER_IMPORTS"))
+
+def lazy_import(name):
+    """
+    Returns the named module, but doesn't actually execute it until one of its attributes is first used.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if EAGER_IMPORTS:
+        return importlib.import_module(name)
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module